@@ -7,10 +7,12 @@ Antigravity Telegram Bot v2.0
 import os
 import sys
 import logging
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
+from collections import OrderedDict
 import asyncio
 
 from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -19,7 +21,6 @@ from telegram.ext import (
     ContextTypes,
     JobQueue,
 )
-import google.generativeai as genai
 
 # 添加项目路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -37,21 +38,76 @@ CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 TIMEZONE = os.getenv('TIMEZONE', 'Asia/Shanghai')  # 中国时间
 
+# Webhook 配置（设置 WEBHOOK_URL 即启用 webhook 模式，否则使用轮询）
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # 例如 https://xxx.up.railway.app
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_PORT = int(os.getenv('PORT', '8443'))
+
+# 只订阅实际处理的更新类型，减少无用推送
+ALLOWED_UPDATES = [Update.MESSAGE]
+
 # 推送时间配置（中国时间）
 PUSH_SCHEDULE = {
     "market_monitor": {"hour": 10, "minute": 0},  # 上午10:00
     "momentum50": {"hour": 10, "minute": 30},      # 上午10:30
 }
 
-# 配置 Gemini
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    gemini_model = genai.GenerativeModel('gemini-2.0-flash')
-    logger.info("✅ Gemini AI 已配置")
-else:
-    gemini_model = None
+# 时间显示格式
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Gemini 并发上限（替代每次调用固定 sleep 的伪限流）
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '4'))
+gemini_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+# AI 回复缓存配置（秒）
+AI_CACHE_TTL = {
+    "default": int(os.getenv('AI_CACHE_TTL', '600')),  # 普通对话 / 本周关注: 10 分钟
+    "ticker": 24 * 3600,                                # 标的分析: 24 小时
+}
+AI_CACHE_MAX_SIZE = 256
+
+# 流式输出时编辑消息的最小间隔（秒），遵守 Telegram 单聊天约 1 条/秒的限制
+STREAM_EDIT_INTERVAL = 1.5
+
+# 单条消息长度上限（Telegram 限制 4096 字符，留出余量给标题/格式）
+MESSAGE_CHUNK_SIZE = 4000
+
+# 配置 Gemini（google.generativeai 依赖 gRPC/protobuf，导入较重，首次调用时再初始化）
+AI_ENABLED = bool(GEMINI_API_KEY)
+
+if not AI_ENABLED:
     logger.warning("⚠️ 未配置 GEMINI_API_KEY，AI 功能不可用")
 
+
+def get_gemini_model():
+    """
+    获取 Gemini 模型，首次调用时导入并配置
+
+    与 utils.ai_analyzer 共用同一个 GenerativeModel，整个进程只配置一次、
+    复用同一条 gRPC 连接
+    """
+    from utils import ai_analyzer
+
+    if ai_analyzer.gemini_model is None and AI_ENABLED:
+        ai_analyzer.init_gemini()
+
+    return ai_analyzer.gemini_model
+
+
+# utils.daily_push 首次使用时导入，之后复用模块引用
+daily_push = None
+
+
+def get_daily_push():
+    """获取 utils.daily_push 模块"""
+    global daily_push
+
+    if daily_push is None:
+        from utils import daily_push as module
+        daily_push = module
+
+    return daily_push
+
 # AI 系统提示词
 SYSTEM_PROMPT = """你是 Antigravity 投研助手，一个专业的美股投资分析 AI。
 
@@ -75,34 +131,165 @@ SYSTEM_PROMPT = """你是 Antigravity 投研助手，一个专业的美股投资
 请用中文回复，保持专业但友好的语气。回复控制在 300 字以内，除非用户要求详细分析。
 """
 
+# 静态前缀只拼接一次；放在每个请求最前面，便于 Gemini 隐式前缀缓存命中
+SYSTEM_PROMPT_PREFIX = f"{SYSTEM_PROMPT}\n\n"
+
 
 # ============== AI 功能 ==============
 
-async def ask_ai(prompt: str, context: str = "") -> str:
-    """调用 Gemini AI（带限流）"""
-    if not gemini_model:
+# 回复缓存: {key: (过期时间, 回复)}，按 LRU 淘汰
+ai_response_cache = OrderedDict()
+
+
+def _ai_cache_key(prompt: str, context: str) -> str:
+    """归一化提示词（去除多余空白、忽略大小写），让重复/近似的提问命中同一缓存"""
+    return " ".join(f"{context}\n{prompt}".split()).lower()
+
+
+def _ai_cache_get(key: str):
+    """读取缓存，过期则删除"""
+    entry = ai_response_cache.get(key)
+    if not entry:
+        return None
+
+    expires_at, response = entry
+    if datetime.now() >= expires_at:
+        del ai_response_cache[key]
+        return None
+
+    ai_response_cache.move_to_end(key)
+    return response
+
+
+def _ai_cache_set(key: str, response: str, ttl: int):
+    """写入缓存，超出容量时淘汰最久未使用的条目"""
+    ai_response_cache[key] = (datetime.now() + timedelta(seconds=ttl), response)
+    ai_response_cache.move_to_end(key)
+    while len(ai_response_cache) > AI_CACHE_MAX_SIZE:
+        ai_response_cache.popitem(last=False)
+
+
+async def ask_ai(prompt: str, context: str = "", cache_ttl: int = None, on_update=None) -> str:
+    """
+    调用 Gemini AI（异步，带并发限流和回复缓存）
+
+    Args:
+        prompt: 用户消息
+        context: 上下文（可选）
+        cache_ttl: 缓存时间（秒），默认 AI_CACHE_TTL["default"]，0 表示不缓存
+        on_update: 流式回调 async (partial_text) -> None（可选），
+            传入时以 stream=True 调用，并按 STREAM_EDIT_INTERVAL 节流回调
+
+    Returns:
+        str: 完整回复
+    """
+    if not AI_ENABLED:
         return "❌ AI 功能未配置，请添加 GEMINI_API_KEY"
 
-    try:
-        full_prompt = f"{SYSTEM_PROMPT}\n\n"
-        if context:
-            full_prompt += f"上下文：{context}\n\n"
-        full_prompt += f"用户消息：{prompt}"
+    if cache_ttl is None:
+        cache_ttl = AI_CACHE_TTL["default"]
 
-        # 简单限流：每次调用等待
-        await asyncio.sleep(1)
+    cache_key = _ai_cache_key(prompt, context)
+    if cache_ttl:
+        cached = _ai_cache_get(cache_key)
+        if cached:
+            logger.info("AI 缓存命中")
+            return cached
 
-        response = gemini_model.generate_content(full_prompt)
-        return response.text
+    try:
+        if context:
+            full_prompt = f"{SYSTEM_PROMPT_PREFIX}上下文：{context}\n\n用户消息：{prompt}"
+        else:
+            full_prompt = f"{SYSTEM_PROMPT_PREFIX}用户消息：{prompt}"
+
+        model = get_gemini_model()
+        if not model:
+            return "❌ AI 初始化失败，请检查 GEMINI_API_KEY"
+
+        # 并发限流：异步调用不阻塞事件循环，同时限制并发数
+        async with gemini_semaphore:
+            if on_update:
+                text = await _stream_content(model, full_prompt, on_update)
+            else:
+                response = await model.generate_content_async(full_prompt)
+                text = response.text
+
+        # 只缓存成功的回复，错误提示不入缓存
+        if cache_ttl:
+            _ai_cache_set(cache_key, text, cache_ttl)
+        return text
     except Exception as e:
         error_msg = str(e).lower()
         if "rate" in error_msg or "quota" in error_msg:
-            logger.warning(f"Gemini 速率限制: {e}")
+            logger.warning("Gemini 速率限制: %s", e)
             return "⏳ AI 服务繁忙，请稍后再试"
-        logger.error(f"AI 调用失败: {e}")
+        logger.error("AI 调用失败: %s", e)
         return f"❌ AI 调用出错: {str(e)}"
 
 
+async def _stream_content(model, full_prompt: str, on_update) -> str:
+    """流式读取 Gemini 回复，节流调用 on_update，返回完整文本"""
+    loop = asyncio.get_running_loop()
+    response = await model.generate_content_async(full_prompt, stream=True)
+
+    buffer = ""
+    last_update = loop.time()
+    async for chunk in response:
+        buffer += chunk.text
+        if loop.time() - last_update >= STREAM_EDIT_INTERVAL:
+            await on_update(buffer)
+            last_update = loop.time()
+
+    return buffer
+
+
+def stream_to_message(message, header: str = ""):
+    """生成把流式内容写回“思考中”消息的回调（中间态用纯文本，避免 Markdown 未闭合报错）"""
+    async def on_update(partial: str):
+        try:
+            await message.edit_text(f"{header}{partial[:MESSAGE_CHUNK_SIZE - len(header)]} ▌")
+        except Exception as e:
+            logger.debug("流式更新消息失败: %s", e)
+
+    return on_update
+
+
+def split_message(text: str, limit: int = MESSAGE_CHUNK_SIZE) -> list:
+    """按段落/换行切分长文本，每段不超过 limit 字符"""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+async def send_chunk(send, chunk: str, parse_mode: str = None):
+    """发送一段内容；切分可能截断 Markdown 标记导致解析失败，此时该段改用纯文本重发"""
+    try:
+        await send(chunk, parse_mode=parse_mode)
+    except BadRequest as e:
+        # 只处理 Markdown 解析失败，其余错误（聊天不存在、消息过长等）照常抛出
+        if not parse_mode or "can't parse entities" not in str(e).lower():
+            raise
+        logger.warning("Markdown 解析失败，改用纯文本发送: %s", e)
+        await send(chunk)
+
+
+async def reply_long(message, text: str, parse_mode: str = None):
+    """第一段写回“思考中”消息，其余分段追加发送，避免超长消息发送失败"""
+    chunks = split_message(text) or [text]
+    await send_chunk(message.edit_text, chunks[0], parse_mode)
+    for chunk in chunks[1:]:
+        await send_chunk(message.reply_text, chunk, parse_mode)
+
+
 # ============== 定时任务 ==============
 
 async def scheduled_market_monitor(context: ContextTypes.DEFAULT_TYPE):
@@ -110,10 +297,9 @@ async def scheduled_market_monitor(context: ContextTypes.DEFAULT_TYPE):
     logger.info("执行定时任务: Market Monitor")
 
     try:
-        from utils.daily_push import push_market_monitor
-        await push_market_monitor()
+        await get_daily_push().push_market_monitor()
     except Exception as e:
-        logger.error(f"Market Monitor 推送失败: {e}")
+        logger.error("Market Monitor 推送失败: %s", e)
         if CHAT_ID:
             await context.bot.send_message(
                 chat_id=CHAT_ID,
@@ -126,10 +312,9 @@ async def scheduled_momentum50(context: ContextTypes.DEFAULT_TYPE):
     logger.info("执行定时任务: Momentum 50")
 
     try:
-        from utils.daily_push import push_momentum50
-        await push_momentum50()
+        await get_daily_push().push_momentum50(fresh=True)
     except Exception as e:
-        logger.error(f"Momentum 50 推送失败: {e}")
+        logger.error("Momentum 50 推送失败: %s", e)
         if CHAT_ID:
             await context.bot.send_message(
                 chat_id=CHAT_ID,
@@ -163,7 +348,7 @@ def setup_scheduled_jobs(application: Application):
             days=(0, 1, 2, 3, 4),  # 周一到周五
             name="market_monitor_daily"
         )
-        logger.info(f"✅ Market Monitor 定时任务已设置: {mm_time}")
+        logger.info("✅ Market Monitor 定时任务已设置: %s", mm_time)
 
         # Momentum 50 - 每天上午10点（中国时间）
         m50_time = time(
@@ -177,39 +362,31 @@ def setup_scheduled_jobs(application: Application):
             days=(0, 1, 2, 3, 4),  # 周一到周五
             name="momentum50_daily"
         )
-        logger.info(f"✅ Momentum 50 定时任务已设置: {m50_time}")
+        logger.info("✅ Momentum 50 定时任务已设置: %s", m50_time)
 
     except Exception as e:
-        logger.error(f"设置定时任务失败: {e}")
+        logger.error("设置定时任务失败: %s", e)
 
 
 # ============== 命令处理 ==============
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """处理 /start 命令"""
-    ai_status = "✅ 已启用" if gemini_model else "❌ 未配置"
-
-    await update.message.reply_text(
-        f"🚀 *Antigravity Assistant v2.0 已启动*\n\n"
-        f"AI 分析: {ai_status}\n\n"
-        f"*每日推送 (中国时间):*\n"
-        f"📊 Market Monitor - 10:00 AM\n"
-        f"🚀 Momentum 50 - 10:30 AM\n\n"
-        f"*命令:*\n"
-        f"/mm - 立即获取 Market Monitor\n"
-        f"/m50 - 立即获取 Momentum 50\n"
-        f"/status TICKER - 查看标的状态\n"
-        f"/ask 问题 - 问 AI 任何问题\n"
-        f"/help - 显示帮助\n\n"
-        f"💡 你也可以直接发消息，我会用 AI 回复你！",
-        parse_mode='Markdown'
-    )
-    logger.info(f"用户 Chat ID: {update.effective_chat.id}")
-
+# 静态回复文本（模块加载时构建一次，AI 状态在启动时已确定）
+START_TEXT = (
+    f"🚀 *Antigravity Assistant v2.0 已启动*\n\n"
+    f"AI 分析: {'✅ 已启用' if AI_ENABLED else '❌ 未配置'}\n\n"
+    f"*每日推送 (中国时间):*\n"
+    f"📊 Market Monitor - 10:00 AM\n"
+    f"🚀 Momentum 50 - 10:30 AM\n\n"
+    f"*命令:*\n"
+    f"/mm - 立即获取 Market Monitor\n"
+    f"/m50 - 立即获取 Momentum 50\n"
+    f"/status TICKER - 查看标的状态\n"
+    f"/ask 问题 - 问 AI 任何问题\n"
+    f"/help - 显示帮助\n\n"
+    f"💡 你也可以直接发消息，我会用 AI 回复你！"
+)
 
-async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """处理 /help 命令"""
-    help_text = """
+HELP_TEXT = """
 📋 *命令列表*
 
 *每日推送:*
@@ -236,17 +413,34 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Market Monitor: 10:00 AM
 • Momentum 50: 10:30 AM
     """
-    await update.message.reply_text(help_text, parse_mode='Markdown')
+
+PING_AI_STATUS = "✅" if AI_ENABLED else "❌"
+
+WEEK_PROMPT = """请告诉我本周美股市场需要关注的重点：
+1. 重要财报（如果有）
+2. 宏观数据发布
+3. 市场主题/热点
+保持简洁，用 bullet points。"""
+
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /start 命令"""
+    await update.message.reply_text(START_TEXT, parse_mode='Markdown')
+    logger.info("用户 Chat ID: %s", update.effective_chat.id)
+
+
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /help 命令"""
+    await update.message.reply_text(HELP_TEXT, parse_mode='Markdown')
 
 
 async def ping(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """测试连接"""
-    ai_status = "✅" if gemini_model else "❌"
     await update.message.reply_text(
         f"🏓 Pong!\n"
         f"Bot 运行正常\n"
-        f"AI 状态: {ai_status}\n"
-        f"当前时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        f"AI 状态: {PING_AI_STATUS}\n"
+        f"当前时间: {datetime.now().strftime(DATETIME_FORMAT)}"
     )
 
 
@@ -258,13 +452,13 @@ async def jobs_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("📋 当前没有定时任务")
         return
 
-    job_info = []
-    for job in jobs:
-        next_run = job.next_t.strftime("%Y-%m-%d %H:%M:%S") if job.next_t else "N/A"
-        job_info.append(f"• {job.name}: 下次运行 {next_run}")
+    job_info = "\n".join(
+        f"• {job.name}: 下次运行 {job.next_t.strftime(DATETIME_FORMAT) if job.next_t else 'N/A'}"
+        for job in jobs
+    )
 
     await update.message.reply_text(
-        f"📋 *定时任务状态*\n\n" + "\n".join(job_info),
+        f"📋 *定时任务状态*\n\n{job_info}",
         parse_mode='Markdown'
     )
 
@@ -274,8 +468,7 @@ async def manual_market_monitor(update: Update, context: ContextTypes.DEFAULT_TY
     await update.message.reply_text("📊 正在获取 Market Monitor...")
 
     try:
-        from utils.daily_push import push_market_monitor
-        await push_market_monitor()
+        await get_daily_push().push_market_monitor()
     except Exception as e:
         await update.message.reply_text(f"❌ 获取失败: {str(e)}")
 
@@ -285,8 +478,7 @@ async def manual_momentum50(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("🚀 正在获取 Momentum 50...")
 
     try:
-        from utils.daily_push import push_momentum50
-        await push_momentum50()
+        await get_daily_push().push_momentum50()
     except Exception as e:
         await update.message.reply_text(f"❌ 获取失败: {str(e)}")
 
@@ -296,8 +488,7 @@ async def manual_push_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("📋 开始所有推送...")
 
     try:
-        from utils.daily_push import daily_push_all
-        results = await daily_push_all()
+        results = await get_daily_push().daily_push_all()
         success = sum(results.values())
         total = len(results)
         await update.message.reply_text(f"✅ 推送完成: {success}/{total} 成功")
@@ -314,10 +505,9 @@ async def manual_gmail_brief(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await update.message.reply_text(f"📬 正在获取 Gmail 简报{label_info}...")
 
     try:
-        from utils.daily_push import push_gmail_brief
-        await push_gmail_brief(label=label)
+        await get_daily_push().push_gmail_brief(label=label)
     except Exception as e:
-        logger.error(f"Gmail 简报获取失败: {e}")
+        logger.error("Gmail 简报获取失败: %s", e)
         await update.message.reply_text(f"❌ 获取失败: {str(e)}")
 
 
@@ -330,8 +520,8 @@ async def ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
     question = ' '.join(context.args)
     thinking_msg = await update.message.reply_text("🤔 正在分析...")
 
-    response = await ask_ai(question)
-    await thinking_msg.edit_text(response)
+    response = await ask_ai(question, on_update=stream_to_message(thinking_msg))
+    await reply_long(thinking_msg, response)
 
 
 async def analyze(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -354,8 +544,12 @@ async def analyze(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 请基于公开信息分析，保持客观。"""
 
-    response = await ask_ai(prompt)
-    await thinking_msg.edit_text(f"📊 *{ticker} AI 分析*\n\n{response}", parse_mode='Markdown')
+    response = await ask_ai(
+        prompt,
+        cache_ttl=AI_CACHE_TTL["ticker"],
+        on_update=stream_to_message(thinking_msg, f"📊 {ticker} AI 分析\n\n"),
+    )
+    await reply_long(thinking_msg, f"📊 *{ticker} AI 分析*\n\n{response}", parse_mode='Markdown')
 
 
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -364,13 +558,30 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("请指定标的，例如: /status SHOP")
         return
 
+    from utils.ai_analyzer import lookup_ticker_description
+
     ticker = context.args[0].upper()
+
+    # 简介表命中时直接回复，不走 AI
+    description = lookup_ticker_description(ticker)
+    if description:
+        await send_chunk(
+            update.message.reply_text,
+            f"📊 *{ticker}*\n\n"
+            f"{description}\n\n"
+            f"_实时价格功能开发中..._",
+            parse_mode='Markdown'
+        )
+        return
+
     thinking_msg = await update.message.reply_text(f"📊 查询 {ticker}...")
 
     prompt = f"简要介绍一下 {ticker} 这只股票，包括当前市场关注的焦点（不超过100字）"
-    response = await ask_ai(prompt)
+    response = await ask_ai(prompt, cache_ttl=AI_CACHE_TTL["ticker"])
 
-    await thinking_msg.edit_text(
+    # AI 输出可能含未闭合的 Markdown 标记，解析失败时回退纯文本
+    await send_chunk(
+        thinking_msg.edit_text,
         f"📊 *{ticker}*\n\n"
         f"{response}\n\n"
         f"_实时价格功能开发中..._",
@@ -382,21 +593,15 @@ async def week(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """处理 /week 命令"""
     thinking_msg = await update.message.reply_text("📅 生成本周关注...")
 
-    prompt = """请告诉我本周美股市场需要关注的重点：
-1. 重要财报（如果有）
-2. 宏观数据发布
-3. 市场主题/热点
-保持简洁，用 bullet points。"""
-
-    response = await ask_ai(prompt)
-    await thinking_msg.edit_text(f"📅 *本周关注*\n\n{response}", parse_mode='Markdown')
+    response = await ask_ai(WEEK_PROMPT, on_update=stream_to_message(thinking_msg, "📅 本周关注\n\n"))
+    await reply_long(thinking_msg, f"📅 *本周关注*\n\n{response}", parse_mode='Markdown')
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """处理普通消息 - 用 AI 回复"""
     text = update.message.text
 
-    if not gemini_model:
+    if not AI_ENABLED:
         await update.message.reply_text(
             "🤔 AI 功能未启用\n"
             "请使用 /help 查看可用命令"
@@ -404,44 +609,69 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     thinking_msg = await update.message.reply_text("🤔 思考中...")
-    response = await ask_ai(text)
-    await thinking_msg.edit_text(response)
+    response = await ask_ai(text, on_update=stream_to_message(thinking_msg))
+    await reply_long(thinking_msg, response)
 
 
 # ============== 启动 Bot ==============
 
+# 命令注册表: (命令, 处理函数)
+COMMAND_HANDLERS = [
+    ("start", start),
+    ("help", help_command),
+    ("ping", ping),
+    ("jobs", jobs_status),
+    ("mm", manual_market_monitor),
+    ("m50", manual_momentum50),
+    ("gmail", manual_gmail_brief),
+    ("push", manual_push_all),
+    ("ask", ask),
+    ("analyze", analyze),
+    ("status", status),
+    ("week", week),
+]
+
+
 def main():
     """启动 Bot"""
     if not TELEGRAM_TOKEN:
         logger.error("未设置 TELEGRAM_TOKEN 环境变量")
         return
 
-    # 创建 Application
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
-
-    # 注册命令处理器
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("ping", ping))
-    application.add_handler(CommandHandler("jobs", jobs_status))
-    application.add_handler(CommandHandler("mm", manual_market_monitor))
-    application.add_handler(CommandHandler("m50", manual_momentum50))
-    application.add_handler(CommandHandler("gmail", manual_gmail_brief))
-    application.add_handler(CommandHandler("push", manual_push_all))
-    application.add_handler(CommandHandler("ask", ask))
-    application.add_handler(CommandHandler("analyze", analyze))
-    application.add_handler(CommandHandler("status", status))
-    application.add_handler(CommandHandler("week", week))
-
-    # 注册消息处理器（处理非命令消息 - AI 回复）
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    # 创建 Application（并发处理更新，AI 调用不会阻塞其他消息）
+    # AIORateLimiter: 全局 30 条/秒 + 单聊天限速，遇到 429 按 retry_after 只暂停该请求；
+    # 与定时推送的 Bot 共用同一个限流器，两者发往同一聊天时共享配额
+    application = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(True)
+        .rate_limiter(get_daily_push().telegram_rate_limiter)
+        .build()
+    )
+
+    # 一次性注册命令处理器 + 消息处理器（处理非命令消息 - AI 回复）
+    application.add_handlers(
+        [CommandHandler(command, callback) for command, callback in COMMAND_HANDLERS]
+        + [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message)]
+    )
 
     # 设置定时任务
     setup_scheduled_jobs(application)
 
     # 启动 Bot
     logger.info("🚀 Antigravity Bot v2.0 启动中...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL:
+        logger.info("Webhook 模式: %s (端口 %s)", WEBHOOK_URL, WEBHOOK_PORT)
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=WEBHOOK_PORT,
+            url_path=TELEGRAM_TOKEN,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{TELEGRAM_TOKEN}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == '__main__':
@@ -5,15 +5,24 @@ Gmail Brief - 云端版本
 """
 
 import os
-import json
-import base64
 import logging
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from email.utils import parsedate_to_datetime
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+from utils.json_io import loads, read_json, write_json
+
+# pybase64 使用 SIMD 解码，速度远快于标准库；未安装时回退到 base64
+import base64 as std_base64
+try:
+    import pybase64 as base64
+except ImportError:
+    base64 = std_base64
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +30,19 @@ logger = logging.getLogger(__name__)
 GMAIL_LABEL = os.getenv('GMAIL_LABEL', 'Newsletter')
 HOURS_TO_LOOK_BACK = int(os.getenv('GMAIL_HOURS_BACK', '24'))
 GMAIL_SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
+# 单个 batch 请求最多打包的调用数（Gmail API 上限 100）
+GMAIL_BATCH_SIZE = 100
+# 并发生成摘要的最大数量（受 AI 提供商限流约束）
+SUMMARY_CONCURRENCY = int(os.getenv('GMAIL_SUMMARY_CONCURRENCY', '4'))
+# 单次 AI 调用合并摘要的邮件数
+SUMMARY_BATCH_SIZE = int(os.getenv('GMAIL_SUMMARY_BATCH_SIZE', '10'))
+# 摘要只用到正文前这么多字符，下载后即截断（状态文件也只保存这部分）
+EMAIL_BODY_CHARS = 3000
+# 增量同步状态（historyId + 时间窗口内已下载的邮件），按标签分别保存
+GMAIL_HISTORY_PATH = os.getenv(
+    'GMAIL_HISTORY_PATH',
+    os.path.join(os.getenv('CLOUD_STORAGE_PATH', './data'), 'gmail_history.json')
+)
 
 
 def get_gmail_credentials():
@@ -36,7 +58,7 @@ def get_gmail_credentials():
         return None
 
     try:
-        token_data = json.loads(token_json)
+        token_data = loads(token_json)
         creds = Credentials(
             token=token_data.get('token'),
             refresh_token=token_data.get('refresh_token'),
@@ -71,15 +93,30 @@ def get_gmail_service():
         return None
 
 
-def get_label_id(service, label_name):
-    """根据标签名称获取标签 ID"""
+# 标签 ID 缓存 {标签名(小写): 标签 ID}，标签 ID 在账号内稳定，进程内复用
+label_id_cache = {}
+
+
+def get_label_id(service, label_name, refresh=False):
+    """
+    根据标签名称获取标签 ID
+
+    首次调用时把账号的全部标签写入缓存，之后直接查缓存；
+    refresh=True 时强制重新拉取（标签被删除/重建后使用）
+    """
+    key = label_name.lower()
+    if not refresh and key in label_id_cache:
+        return label_id_cache[key]
+
     try:
         results = service.users().labels().list(userId='me').execute()
         labels = results.get('labels', [])
 
-        for label in labels:
-            if label['name'].lower() == label_name.lower():
-                return label['id']
+        label_id_cache.clear()
+        label_id_cache.update({label['name'].lower(): label['id'] for label in labels})
+
+        if key in label_id_cache:
+            return label_id_cache[key]
 
         logger.warning(f"找不到标签: {label_name}")
         return None
@@ -88,34 +125,234 @@ def get_label_id(service, label_name):
         return None
 
 
+def _decode_body_data(data: str) -> str:
+    """解码 base64url 编码的正文"""
+    # Gmail 返回的数据可能省略 '=' 填充，先补齐，解码走严格格式的快速路径
+    data += '=' * (-len(data) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(data)
+    except ValueError:
+        # 非法输入交给标准库处理
+        raw = std_base64.urlsafe_b64decode(data)
+    return raw.decode('utf-8', errors='ignore')
+
+
 def decode_email_body(payload):
-    """解码邮件正文"""
-    body = ""
-
-    if 'body' in payload and payload['body'].get('data'):
-        body = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8', errors='ignore')
-    elif 'parts' in payload:
-        for part in payload['parts']:
-            mime_type = part.get('mimeType', '')
-            if mime_type == 'text/plain':
-                if 'data' in part.get('body', {}):
-                    body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
-                    break
-            elif mime_type == 'text/html' and not body:
-                if 'data' in part.get('body', {}):
-                    body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
-            elif 'parts' in part:
-                body = decode_email_body(part)
-                if body:
-                    break
-
-    return body
+    """
+    解码邮件正文
+
+    单部分邮件直接解码；多部分邮件迭代遍历 MIME 树，
+    优先返回第一个 text/plain，否则返回第一个 text/html
+    """
+    if payload.get('body', {}).get('data'):
+        return _decode_body_data(payload['body']['data'])
+
+    html_data = None
+    stack = list(reversed(payload.get('parts', [])))
+    while stack:
+        part = stack.pop()
+        mime_type = part.get('mimeType', '')
+        data = part.get('body', {}).get('data')
+
+        if data and mime_type == 'text/plain':
+            return _decode_body_data(data)
+        if data and mime_type == 'text/html' and html_data is None:
+            html_data = data
+
+        # 子节点逆序入栈，保持原有的文档顺序
+        stack.extend(reversed(part.get('parts', [])))
+
+    return _decode_body_data(html_data) if html_data else ""
+
+
+def batch_get_messages(service, message_ids, format='full', **params):
+    """
+    通过 Gmail batch 接口批量获取邮件详情（每 GMAIL_BATCH_SIZE 个一次往返）
+
+    Args:
+        message_ids: 邮件 ID 列表
+        format: full / metadata / minimal / raw
+        **params: 透传给 messages().get 的其他参数（如 metadataHeaders、fields）
+
+    Returns:
+        list: 邮件详情，顺序与 message_ids 一致，获取失败的会被跳过
+    """
+    results = {}
+
+    def on_response(request_id, response, exception):
+        if exception:
+            logger.warning(f"获取邮件 {request_id} 失败: {exception}")
+            return
+        results[request_id] = response
+
+    for start in range(0, len(message_ids), GMAIL_BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=on_response)
+        for msg_id in message_ids[start:start + GMAIL_BATCH_SIZE]:
+            batch.add(
+                service.users().messages().get(userId='me', id=msg_id, format=format, **params),
+                request_id=msg_id
+            )
+        batch.execute()
+
+    return [results[msg_id] for msg_id in message_ids if msg_id in results]
+
+
+def list_label_messages(service, label_id, query):
+    """列出指定标签下符合查询条件的邮件"""
+    return service.users().messages().list(
+        userId='me',
+        labelIds=[label_id],
+        q=query,
+        maxResults=50
+    ).execute()
+
+
+def load_history_state(label_name: str):
+    """读取指定标签的增量同步状态，不存在返回 None"""
+    try:
+        return read_json(GMAIL_HISTORY_PATH).get(label_name)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"读取 Gmail 同步状态失败: {e}")
+        return None
+
+
+def save_history_state(label_name: str, state: dict):
+    """保存指定标签的增量同步状态"""
+    try:
+        all_states = read_json(GMAIL_HISTORY_PATH)
+    except Exception:
+        all_states = {}
+
+    all_states[label_name] = state
+
+    try:
+        write_json(GMAIL_HISTORY_PATH, all_states)
+    except Exception as e:
+        logger.warning(f"保存 Gmail 同步状态失败: {e}")
+
+
+def list_history_message_ids(service, label_id, start_history_id):
+    """
+    通过 History API 列出 start_history_id 之后标签下的邮件变化
+
+    新邮件和后来才被打上标签的邮件（手动加标签、延后执行的过滤器）都算新增；
+    被移除标签或被删除的邮件记为移除，调用方据此清理已缓存的记录。
+    不按 labelId 过滤：移除标签/删除事件中的邮件可能已不带该标签
+
+    Returns:
+        tuple: (新增邮件 ID 列表, 移除邮件 ID 集合, 最新 historyId)
+
+    Raises:
+        HttpError: historyId 过期时返回 404，由调用方回退到完整查询
+    """
+    # 按历史顺序回放：同一封邮件先加后删（或反之）以最后一次变化为准
+    added = {}
+    removed = set()
+    page_token = None
+
+    def mark_added(msg_id):
+        added[msg_id] = None
+        removed.discard(msg_id)
+
+    def mark_removed(msg_id):
+        added.pop(msg_id, None)
+        removed.add(msg_id)
+
+    while True:
+        response = service.users().history().list(
+            userId='me',
+            startHistoryId=start_history_id,
+            historyTypes=['messageAdded', 'labelAdded', 'labelRemoved', 'messageDeleted'],
+            pageToken=page_token
+        ).execute()
+
+        for record in response.get('history', []):
+            for item in record.get('messagesAdded', []):
+                if label_id in item['message'].get('labelIds', []):
+                    mark_added(item['message']['id'])
+            for item in record.get('labelsAdded', []):
+                if label_id in item.get('labelIds', []):
+                    mark_added(item['message']['id'])
+            for item in record.get('labelsRemoved', []):
+                if label_id in item.get('labelIds', []):
+                    mark_removed(item['message']['id'])
+            for item in record.get('messagesDeleted', []):
+                mark_removed(item['message']['id'])
+
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return list(added), removed, response['historyId']
+
+
+def fetch_message_details(service, message_ids, after_ts):
+    """
+    批量获取邮件详情
+
+    先只取邮件头做时间过滤，正文只为过滤后留下的邮件下载
+
+    Args:
+        message_ids: 邮件 ID 列表
+        after_ts: 时间下限（毫秒时间戳），更早的邮件被丢弃
+
+    Returns:
+        list: 邮件记录，每封包含 id, subject, sender, ts, snippet, body
+    """
+    if not message_ids:
+        return []
+
+    details = batch_get_messages(
+        service,
+        message_ids,
+        format='metadata',
+        metadataHeaders=['Subject', 'From']
+    )
+
+    records = []
+    for message in details:
+        # 使用服务器接收时间（毫秒时间戳），无需解析 Date 头
+        ts = int(message['internalDate'])
+
+        # 检查是否在时间范围内
+        if ts < after_ts:
+            continue
+
+        # 邮件头一次性建成字典（同名头保留第一个）
+        headers = {}
+        for h in message.get('payload', {}).get('headers', []):
+            headers.setdefault(h['name'].lower(), h['value'])
+
+        records.append({
+            'id': message['id'],
+            'subject': headers.get('subject', '(无主题)'),
+            'sender': headers.get('from', '(未知发件人)'),
+            'ts': ts,
+            'snippet': message.get('snippet', '')
+        })
+
+    # 只为时间范围内的邮件下载完整正文
+    bodies = batch_get_messages(
+        service,
+        [record['id'] for record in records],
+        format='full',
+        fields='id,payload'
+    )
+    payloads = {message['id']: message.get('payload', {}) for message in bodies}
+    for record in records:
+        body = decode_email_body(payloads.get(record['id'], {}))
+        record['body'] = body[:EMAIL_BODY_CHARS] if body else record['snippet']
+
+    return records
 
 
 def fetch_gmail_emails(label_name=None, hours_back=None):
     """
     获取指定标签的邮件
 
+    有上次的同步状态时只通过 History API 下载新增邮件，
+    时间窗口内之前下载过的邮件直接从状态文件读取
+
     Args:
         label_name: 邮件标签名称
         hours_back: 查看多少小时内的邮件
@@ -138,72 +375,83 @@ def fetch_gmail_emails(label_name=None, hours_back=None):
 
     # 计算时间过滤
     after_time = datetime.now(timezone.utc) - timedelta(hours=hours_back)
+    after_ts = int(after_time.timestamp() * 1000)
     query = f"after:{after_time.strftime('%Y/%m/%d')}"
 
     try:
-        # 获取邮件列表
-        results = service.users().messages().list(
-            userId='me',
-            labelIds=[label_id],
-            q=query,
-            maxResults=50
-        ).execute()
+        records = None
+        state = load_history_state(label_name)
 
-        messages = results.get('messages', [])
-
-        if not messages:
+        # 增量同步：状态覆盖了本次的时间窗口时才可用
+        if state and state.get('since_ts', after_ts + 1) <= after_ts:
+            try:
+                new_ids, removed_ids, history_id = list_history_message_ids(
+                    service, label_id, state['history_id']
+                )
+                known = {
+                    record['id']: record
+                    for record in state['messages']
+                    if record['ts'] >= after_ts and record['id'] not in removed_ids
+                }
+                new_ids = [msg_id for msg_id in new_ids if msg_id not in known]
+                logger.info(f"增量同步: {len(new_ids)} 封新邮件，{len(removed_ids)} 封已移除，{len(known)} 封已缓存")
+                records = list(known.values()) + fetch_message_details(service, new_ids, after_ts)
+                since_ts = after_ts
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                # historyId 过期或标签 ID 失效，回退到完整查询
+                logger.info("historyId 已失效，回退到完整查询")
+
+        if records is None:
+            # 先记下当前 historyId，列表之后到达的邮件下次增量同步能拿到
+            history_id = service.users().getProfile(userId='me').execute()['historyId']
+
+            # 获取邮件列表
+            try:
+                results = list_label_messages(service, label_id, query)
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                # 缓存的标签 ID 已失效，刷新后重试一次
+                logger.info(f"标签 ID 失效，重新获取: {label_name}")
+                label_id = get_label_id(service, label_name, refresh=True)
+                if not label_id:
+                    return []
+                results = list_label_messages(service, label_id, query)
+
+            messages = results.get('messages', [])
+            logger.info(f"找到 {len(messages)} 封邮件")
+            records = fetch_message_details(service, [msg['id'] for msg in messages], after_ts)
+            since_ts = after_ts
+
+        save_history_state(label_name, {
+            'history_id': history_id,
+            'since_ts': since_ts,
+            'messages': records
+        })
+
+        if not records:
             logger.info(f"最近 {hours_back} 小时内没有标签为 [{label_name}] 的新邮件")
             return []
 
-        logger.info(f"找到 {len(messages)} 封邮件")
-
-        emails = []
-        for msg in messages:
-            # 获取邮件详情
-            message = service.users().messages().get(
-                userId='me',
-                id=msg['id'],
-                format='full'
-            ).execute()
-
-            headers = message.get('payload', {}).get('headers', [])
-
-            # 提取邮件信息
-            subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), '(无主题)')
-            sender = next((h['value'] for h in headers if h['name'].lower() == 'from'), '(未知发件人)')
-            date_str = next((h['value'] for h in headers if h['name'].lower() == 'date'), '')
-
-            # 解析日期
-            try:
-                date = parsedate_to_datetime(date_str)
-                if date.tzinfo is None:
-                    date = date.replace(tzinfo=timezone.utc)
-            except:
-                date = datetime.now(timezone.utc)
-
-            # 检查是否在时间范围内
-            if date < after_time:
-                continue
-
-            # 获取邮件正文
-            body = decode_email_body(message.get('payload', {}))
-            snippet = message.get('snippet', '')
-
-            # 生成 Gmail 邮件链接
-            msg_id = msg['id']
-            gmail_link = f"https://mail.google.com/mail/u/0/#inbox/{msg_id}"
-
-            emails.append({
-                'subject': subject,
-                'sender': sender,
-                'date': date,
-                'body': body[:10000] if body else snippet,
-                'snippet': snippet,
-                'gmail_link': gmail_link
-            })
-
-        # 按时间排序，最新的在前
-        emails.sort(key=lambda x: x['date'], reverse=True)
+        # 按时间排序，最新的在前（直接比较整数时间戳）
+        records.sort(key=itemgetter('ts'), reverse=True)
+
+        emails = [
+            {
+                'id': record['id'],
+                'subject': record['subject'],
+                'sender': record['sender'],
+                'ts': record['ts'],
+                'date': datetime.fromtimestamp(record['ts'] / 1000, tz=timezone.utc),
+                'snippet': record['snippet'],
+                'body': record['body'],
+                # 生成 Gmail 邮件链接
+                'gmail_link': f"https://mail.google.com/mail/u/0/#inbox/{record['id']}"
+            }
+            for record in records
+        ]
 
         return emails
 
@@ -212,25 +460,124 @@ def fetch_gmail_emails(label_name=None, hours_back=None):
         return []
 
 
+def email_cache_key(email: dict) -> str:
+    """邮件摘要缓存键：只取邮件内容，不含提示词模板，模板调整不会让缓存失效"""
+    from utils.llm_cache import make_key
+    return make_key("email_summary", email['subject'], email['body'][:EMAIL_BODY_CHARS])
+
+
 def summarize_email_with_ai(email: dict) -> str:
-    """使用 AI 对单封邮件进行摘要"""
+    """使用 AI 对单封邮件进行摘要（按主题+正文缓存，重复邮件不重复调用）"""
     from utils.ai_analyzer import analyze
+    from utils.llm_cache import get_cached, set_cached
+
+    cache_key = email_cache_key(email)
+    cached = get_cached(cache_key)
+    if cached:
+        return cached
 
     prompt = f"""请对以下邮件内容进行简洁的中文摘要（2-3句话），提取关键信息：
 
 邮件主题: {email['subject']}
 发件人: {email['sender']}
 内容摘要:
-{email['body'][:3000]}
+{email['body'][:EMAIL_BODY_CHARS]}
 
 输出格式：直接输出摘要，不要任何前缀。重点突出主要信息和关键数据。"""
 
     result = analyze(prompt, prefer="gemini")
     if result:
+        set_cached(cache_key, result)
         return result
     return email.get('snippet', '(无法生成摘要)')[:200]
 
 
+def summarize_emails_batch(emails: list) -> dict:
+    """
+    一次 AI 调用为多封邮件生成摘要
+
+    Returns:
+        dict: {邮件序号(从1开始): 摘要}，解析失败返回空字典
+    """
+    from utils.ai_analyzer import analyze
+
+    email_blocks = "\n\n".join(
+        f"""### 邮件 {i}
+邮件主题: {email['subject']}
+发件人: {email['sender']}
+内容摘要:
+{email['body'][:EMAIL_BODY_CHARS]}"""
+        for i, email in enumerate(emails, 1)
+    )
+
+    prompt = f"""请对以下每封邮件分别进行简洁的中文摘要（每封2-3句话），提取关键信息，重点突出主要信息和关键数据。
+
+输出格式：只输出 JSON 数组，不要任何其他内容，例如
+[{{"id": 1, "summary": "摘要"}}, {{"id": 2, "summary": "摘要"}}]
+
+{email_blocks}"""
+
+    result = analyze(prompt, prefer="gemini")
+    if not result:
+        return {}
+
+    # 去掉可能的 ```json 代码块包裹
+    start, end = result.find('['), result.rfind(']')
+    if start == -1 or end <= start:
+        logger.warning("批量摘要返回格式无效")
+        return {}
+
+    try:
+        items = loads(result[start:end + 1])
+        return {
+            int(item['id']): item['summary'].strip()
+            for item in items
+            if item.get('summary')
+        }
+    except Exception as e:
+        logger.warning(f"批量摘要解析失败: {e}")
+        return {}
+
+
+def summarize_emails(emails: list):
+    """
+    为邮件列表生成摘要，写入 email['summary']
+
+    1. 先查缓存
+    2. 未命中的邮件按 SUMMARY_BATCH_SIZE 合并成一次 AI 调用（批次间并发）
+    3. 批量结果缺失的邮件回退到单封摘要
+    """
+    from utils.llm_cache import get_cached, set_cached
+
+    pending = []
+    for email in emails:
+        cached = get_cached(email_cache_key(email))
+        if cached:
+            email['summary'] = cached
+        else:
+            pending.append(email)
+
+    if not pending:
+        return
+
+    batches = [pending[i:i + SUMMARY_BATCH_SIZE] for i in range(0, len(pending), SUMMARY_BATCH_SIZE)]
+    logger.info(f"正在生成 {len(pending)} 封邮件的摘要 ({len(batches)} 次批量调用)...")
+
+    with ThreadPoolExecutor(max_workers=SUMMARY_CONCURRENCY) as executor:
+        for batch, summaries in zip(batches, executor.map(summarize_emails_batch, batches)):
+            for i, email in enumerate(batch, 1):
+                if summaries.get(i):
+                    email['summary'] = summaries[i]
+                    set_cached(email_cache_key(email), summaries[i])
+
+        # 批量结果中缺失的邮件逐封摘要
+        missing = [email for email in pending if 'summary' not in email]
+        if missing:
+            logger.info(f"{len(missing)} 封邮件回退到单封摘要")
+            for email, summary in zip(missing, executor.map(summarize_email_with_ai, missing)):
+                email['summary'] = summary
+
+
 def generate_gmail_brief(emails: list) -> dict:
     """
     生成 Gmail 简报
@@ -249,11 +596,8 @@ def generate_gmail_brief(emails: list) -> dict:
             'telegram_message': '📭 *Gmail 简报*\n\n今日没有新邮件'
         }
 
-    # 对每封邮件生成摘要
-    logger.info(f"正在生成 {len(emails)} 封邮件的摘要...")
-    for i, email in enumerate(emails):
-        logger.info(f"处理 ({i+1}/{len(emails)}): {email['subject'][:30]}...")
-        email['summary'] = summarize_email_with_ai(email)
+    # 生成每封邮件的摘要
+    summarize_emails(emails)
 
     # 生成整体摘要
     from utils.ai_analyzer import analyze
@@ -273,12 +617,12 @@ def generate_gmail_brief(emails: list) -> dict:
 
     # 生成 Telegram 消息
     date_str = datetime.now().strftime("%Y-%m-%d")
-    telegram_message = f"""📬 *Gmail 简报 {date_str}*
+    parts = [f"""📬 *Gmail 简报 {date_str}*
 
 📊 *今日概览*
 {overall_summary}
 
-"""
+"""]
 
     # 添加每封邮件的摘要
     for i, email in enumerate(emails[:10], 1):
@@ -287,15 +631,17 @@ def generate_gmail_brief(emails: list) -> dict:
         if len(sender) > 20:
             sender = sender[:20] + '...'
 
-        telegram_message += f"""*{i}. {email['subject'][:50]}*
+        parts.append(f"""*{i}. {email['subject'][:50]}*
 📤 {sender}
 {email['summary'][:150]}
 🔗 [查看原文]({email['gmail_link']})
 
-"""
+""")
 
     if len(emails) > 10:
-        telegram_message += f"_...还有 {len(emails) - 10} 封邮件_"
+        parts.append(f"_...还有 {len(emails) - 10} 封邮件_")
+
+    telegram_message = "".join(parts)
 
     return {
         'emails': emails,
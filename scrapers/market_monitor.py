@@ -6,12 +6,14 @@ Market Monitor Scraper
 """
 
 import csv
-import io
 import re
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
-from typing import Optional, Dict, List
+from types import MappingProxyType
+from typing import Optional, Dict, List, Iterable, Iterator
 
 logger = logging.getLogger(__name__)
 
@@ -20,67 +22,126 @@ SHEET_ID = "1O6OhS7ciA8zwfycBfGPbP2fWJnR0pn2UUvFZVDP9jpE"
 SHEET_GID = "1082103394"
 CSV_URL = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/export?format=csv&gid={SHEET_GID}"
 
-# 指标说明
-INDICATOR_MEANINGS = {
+# 复用的 HTTP 会话（keep-alive 连接池 + 瞬时错误自动重试）
+session = requests.Session()
+session.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+})
+session.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+))
+
+# CSV 响应缓存: 10 分钟内直接用缓存，之后 1 小时内先返回旧数据并后台刷新
+CSV_CACHE_MAX_AGE = 600
+CSV_CACHE_SWR = 3600
+
+# 默认解析的最近天数（推送只用到最近 10 天，留出余量）
+MM_ROW_LIMIT = 30
+
+# 日期单元格格式 (如 "2/3/2026")
+DATE_RE = re.compile(r'^\d{1,2}/\d{1,2}/\d{4}')
+
+# 指标说明（只读）
+INDICATOR_MEANINGS = MappingProxyType({
     "up_4pct": "当日涨幅超过4%的股票数量，高值=市场强势",
     "down_4pct": "当日跌幅超过4%的股票数量，高值=市场弱势",
     "ratio_5d": "5日涨跌比，>1=bullish, <1=bearish",
     "ratio_10d": "10日涨跌比，>1=bullish, <1=bearish",
-}
+})
 
-# 极值阈值
-EXTREME_THRESHOLDS = {
-    "up_4pct": {"extreme_high": 500, "high": 300, "low": 100},
-    "down_4pct": {"extreme_high": 500, "high": 300, "low": 100},
-    "ratio_5d": {"extreme_high": 2.0, "high": 1.5, "low": 0.5, "extreme_low": 0.3},
-    "ratio_10d": {"extreme_high": 1.5, "high": 1.2, "low": 0.8, "extreme_low": 0.6},
-}
+# 极值阈值（只读，防止调用方意外修改模块级配置）
+EXTREME_THRESHOLDS = MappingProxyType({
+    "up_4pct": MappingProxyType({"extreme_high": 500, "high": 300, "low": 100}),
+    "down_4pct": MappingProxyType({"extreme_high": 500, "high": 300, "low": 100}),
+    "ratio_5d": MappingProxyType({"extreme_high": 2.0, "high": 1.5, "low": 0.5, "extreme_low": 0.3}),
+    "ratio_10d": MappingProxyType({"extreme_high": 1.5, "high": 1.2, "low": 0.8, "extreme_low": 0.6}),
+})
+
+# 极值检查规则（模块加载时展开）: (指标, 极高阈值, 极低阈值)，无对应阈值为 None
+EXTREME_RULES = tuple(
+    (key, thresholds.get("extreme_high"), thresholds.get("extreme_low"))
+    for key, thresholds in EXTREME_THRESHOLDS.items()
+)
 
 
 def parse_int(s: str) -> int:
-    """解析整数，处理逗号分隔符"""
+    """解析整数，处理逗号分隔符（无逗号时直接转换，不产生新字符串）"""
     try:
-        return int(str(s).replace(',', '').strip())
-    except:
-        return 0
+        return int(s)
+    except (ValueError, TypeError):
+        try:
+            return int(s.replace(',', '').strip())
+        except (ValueError, AttributeError):
+            return 0
 
 
 def parse_float(s: str) -> float:
     """解析浮点数"""
     try:
-        return float(str(s).replace(',', '').strip())
-    except:
-        return 0.0
+        return float(s)
+    except (ValueError, TypeError):
+        try:
+            return float(s.replace(',', '').strip())
+        except (ValueError, AttributeError):
+            return 0.0
 
 
-def fetch_csv_data() -> Optional[List[List[str]]]:
-    """直接从 Google Sheets 获取 CSV 数据"""
-    logger.info(f"正在从 Google Sheets 获取数据...")
+# 列定义: (字段名, 列索引, 解析函数)
+BASE_COLUMNS = (
+    ("up_4pct", 1, parse_int),
+    ("down_4pct", 2, parse_int),
+    ("ratio_5d", 3, parse_float),
+    ("ratio_10d", 4, parse_float),
+    ("up_25pct_qtr", 5, parse_int),
+    ("down_25pct_qtr", 6, parse_int),
+)
 
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(CSV_URL, headers=headers, timeout=30)
-        response.raise_for_status()
+# 额外指标（行宽 >= 11 时才有）
+EXTENDED_COLUMNS = BASE_COLUMNS + (
+    ("up_25pct_month", 7, parse_int),
+    ("down_25pct_month", 8, parse_int),
+    ("up_50pct_month", 9, parse_int),
+    ("down_50pct_month", 10, parse_int),
+)
 
-        # 解析 CSV
-        reader = csv.reader(io.StringIO(response.text))
-        rows = list(reader)
 
-        logger.info(f"获取到 {len(rows)} 行数据")
-        return rows
+def iter_csv_file(path: str) -> Iterator[List[str]]:
+    """逐行解析本地 CSV 文件"""
+    with open(path, newline='', encoding='utf-8') as f:
+        yield from csv.reader(f)
 
-    except requests.exceptions.RequestException as e:
-        logger.error(f"请求失败: {e}")
-        return None
-    except Exception as e:
-        logger.error(f"解析失败: {e}")
+
+def fetch_csv_data(swr: int = CSV_CACHE_SWR) -> Optional[Iterator[List[str]]]:
+    """
+    直接从 Google Sheets 获取 CSV 数据
+
+    数据每个交易日只更新一次，响应缓存在磁盘上（stale-while-revalidate），
+    返回逐行解析的迭代器，整个 CSV 不会一次性载入内存
+
+    Args:
+        swr: 缓存过期后仍可先返回旧数据的时长（秒），0 表示过期即同步重新抓取
+    """
+    from utils.http_cache import cached_download
+
+    logger.info(f"正在从 Google Sheets 获取数据...")
+
+    path = cached_download(session, CSV_URL, max_age=CSV_CACHE_MAX_AGE, swr=swr)
+    if path is None:
         return None
 
+    return iter_csv_file(path)
 
-def parse_table_data(rows: List[List[str]]) -> List[Dict]:
-    """解析表格数据"""
+
+def parse_table_data(rows: Iterable[List[str]], limit: Optional[int] = None) -> List[Dict]:
+    """
+    解析表格数据（rows 可以是任意行迭代器）
+
+    Args:
+        rows: CSV 行迭代器（最新日期在前）
+        limit: 解析到多少条数据行后停止，None 表示全部解析
+    """
     data = []
 
     for row in rows:
@@ -88,47 +149,41 @@ def parse_table_data(rows: List[List[str]]) -> List[Dict]:
             continue
 
         first_cell = row[0].strip()
-        # 检查是否是日期格式 (如 "2/3/2026")
-        if not re.match(r'\d{1,2}/\d{1,2}/\d{4}', first_cell):
+        # 检查是否是日期格式 (如 "2/3/2026")，非数字开头的表头/空行先快速跳过
+        if not first_cell[:1].isdigit() or not DATE_RE.match(first_cell):
             continue
 
-        try:
-            row_data = {
-                "date": first_cell,
-                "up_4pct": parse_int(row[1]) if len(row) > 1 else 0,
-                "down_4pct": parse_int(row[2]) if len(row) > 2 else 0,
-                "ratio_5d": parse_float(row[3]) if len(row) > 3 else 0,
-                "ratio_10d": parse_float(row[4]) if len(row) > 4 else 0,
-                "up_25pct_qtr": parse_int(row[5]) if len(row) > 5 else 0,
-                "down_25pct_qtr": parse_int(row[6]) if len(row) > 6 else 0,
-            }
-
-            # 额外指标
-            if len(row) >= 11:
-                row_data.update({
-                    "up_25pct_month": parse_int(row[7]),
-                    "down_25pct_month": parse_int(row[8]),
-                    "up_50pct_month": parse_int(row[9]),
-                    "down_50pct_month": parse_int(row[10]),
-                })
-
-            data.append(row_data)
-        except Exception as e:
-            logger.debug(f"解析行失败: {e}")
-            continue
+        # 按列定义一次性转换：长度已由上面的检查保证，解析函数不会抛异常
+        columns = EXTENDED_COLUMNS if len(row) >= 11 else BASE_COLUMNS
+        row_data = {"date": first_cell}
+        row_data.update((key, parser(row[idx])) for key, idx, parser in columns)
+        data.append(row_data)
+
+        if limit is not None and len(data) >= limit:
+            break
 
     return data
 
 
-def fetch_market_monitor() -> Optional[Dict]:
-    """抓取 Market Monitor 数据 - 主入口函数"""
-    rows = fetch_csv_data()
+def fetch_market_monitor(limit: Optional[int] = MM_ROW_LIMIT, swr: int = CSV_CACHE_SWR) -> Optional[Dict]:
+    """
+    抓取 Market Monitor 数据 - 主入口函数
+
+    Args:
+        limit: 只解析最近多少天的数据，None 表示全部历史
+        swr: 缓存过期后仍可先返回旧数据的时长（秒），推送时传 0 保证拿到最新数据
+    """
+    rows = fetch_csv_data(swr=swr)
 
-    if not rows:
+    if rows is None:
         logger.error("无法获取 CSV 数据")
         return None
 
-    data = parse_table_data(rows)
+    try:
+        data = parse_table_data(rows, limit=limit)
+    except Exception as e:
+        logger.error(f"解析失败: {e}")
+        return None
 
     if not data:
         logger.error("无法解析表格数据")
@@ -145,12 +200,15 @@ def fetch_market_monitor() -> Optional[Dict]:
 
 
 def analyze_trend(data: list, days: int = 5) -> dict:
-    """分析趋势变化"""
+    """
+    分析趋势变化
+
+    只比较最新两天，days 保留用于兼容调用方
+    """
     if not data or len(data) < 2:
         return {"trend": "insufficient_data"}
 
-    recent = data[:days]
-    latest = recent[0]
+    latest, prev = data[0], data[1]
 
     analysis = {
         "date": latest.get("date"),
@@ -160,43 +218,44 @@ def analyze_trend(data: list, days: int = 5) -> dict:
     }
 
     # 检查极值
-    for key, thresholds in EXTREME_THRESHOLDS.items():
+    for key, extreme_high, extreme_low in EXTREME_RULES:
         value = latest.get(key)
         if value is None:
             continue
 
-        if "extreme_high" in thresholds and value >= thresholds["extreme_high"]:
+        if extreme_high is not None and value >= extreme_high:
             analysis["extremes"].append({
                 "indicator": key,
                 "value": value,
                 "level": "extreme_high",
             })
-        elif "extreme_low" in thresholds and value <= thresholds["extreme_low"]:
+        elif extreme_low is not None and value <= extreme_low:
             analysis["extremes"].append({
                 "indicator": key,
                 "value": value,
                 "level": "extreme_low",
             })
 
+    ratio_5d = latest.get("ratio_5d")
+    prev_ratio_5d = prev.get("ratio_5d")
+
     # 趋势变化
-    if len(recent) >= 2:
-        prev = recent[1]
-        if latest.get("ratio_5d") and prev.get("ratio_5d"):
-            change = latest["ratio_5d"] - prev["ratio_5d"]
-            if abs(change) > 0.1:
-                direction = "improving" if change > 0 else "deteriorating"
-                analysis["signals"].append({
-                    "type": "ratio_change",
-                    "indicator": "5日涨跌比",
-                    "change": round(change, 2),
-                    "direction": direction
-                })
+    if ratio_5d and prev_ratio_5d:
+        change = ratio_5d - prev_ratio_5d
+        if abs(change) > 0.1:
+            direction = "improving" if change > 0 else "deteriorating"
+            analysis["signals"].append({
+                "type": "ratio_change",
+                "indicator": "5日涨跌比",
+                "change": round(change, 2),
+                "direction": direction
+            })
 
     # 市场状态
-    if latest.get("ratio_5d"):
-        if latest["ratio_5d"] > 1.2:
+    if ratio_5d:
+        if ratio_5d > 1.2:
             analysis["summary"].append("市场短期强势")
-        elif latest["ratio_5d"] < 0.8:
+        elif ratio_5d < 0.8:
             analysis["summary"].append("市场短期弱势")
 
     return analysis
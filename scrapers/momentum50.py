@@ -8,14 +8,24 @@ Momentum 50 Scraper
 2. 直接访问已知的 Google Sheets URL
 """
 
+import os
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import csv
+import codecs
+import html
 import re
-from io import StringIO
+from itertools import chain, islice
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import logging
 
+from utils.json_io import read_json, write_json
+
 logger = logging.getLogger(__name__)
 
 # Stockbee Momentum 50 页面 URL
@@ -24,13 +34,48 @@ STOCKBEE_M50_URL = "https://stockbee.blogspot.com/p/momentum-50.html"
 # Google Sheet 配置
 SHEET_ID = "1xjbe9SF0HsxwY_Uy3NC2tT92BqK0nhArUaYU16Q0p9M"
 
-# 年份对应的 GID（每年可能需要更新）
+# 年份对应的 GID（每年可能需要更新，只填已确认的 GID，它们都会作为备用地址并发请求）
 YEAR_GIDS = {
     "2026": "1499398020",
     "2025": "0",  # 默认 sheet
-    "2024": "1234567890",  # 示例，需要确认
 }
 
+# 并发回退请求数: Stockbee 页面 + 当前 GID 的 CSV 与 pubhtml + 其余年份的 GID
+FETCH_CONCURRENCY = 2 + len(YEAR_GIDS)
+
+# Stockbee 页面中嵌入的 Google Sheets iframe（直接在原始字节上扫描，无需构建 DOM）
+SHEETS_IFRAME_RE = re.compile(
+    rb'<iframe[^>]+src=["\']((?:https?:)?//docs\.google\.com/spreadsheets/[^"\']+)',
+    re.IGNORECASE
+)
+
+# Sheets URL 中的 sheet ID（兼容 /d/ID 与发布链接 /d/e/ID）和 gid
+SHEET_ID_RE = re.compile(r'/d/(?:e/)?([a-zA-Z0-9_-]+)')
+GID_RE = re.compile(r'gid=(\d+)')
+
+# 表头日期，如 02/03/2026
+DATE_RE = re.compile(r'\d{1,2}/\d{1,2}/\d{4}')
+
+# 股票代码通常是1-5个大写字母，可能带数字
+TICKER_RE = re.compile(r'[A-Z]{1,5}[A-Z0-9]*')
+
+# history 只保留最近几天的榜单（最新/前一日对比与 3 日持续强势分析最多用到 3 天）
+HISTORY_DAYS = 3
+
+# 常见的非股票代码
+INVALID_TICKERS = frozenset({'DATE', 'TICKER', 'STOCK', 'NAME', 'N/A', 'NA', 'NULL'})
+
+# 表格解析：优先用 lxml 直接解析并用预编译 XPath 遍历，未安装时回退到 BeautifulSoup
+try:
+    from lxml import etree, html as lxml_html
+    ROWS_XP = etree.XPath('.//tr')
+    CELLS_XP = etree.XPath('./td|./th')
+except ImportError:
+    lxml_html = None
+
+# BeautifulSoup 回退时只为表格建树
+TABLE_STRAINER = SoupStrainer('table')
+
 # 默认 Headers
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -38,21 +83,90 @@ HEADERS = {
     'Accept-Language': 'en-US,en;q=0.5',
 }
 
+# 抓取结果缓存：同一小时内多次运行直接复用，不再重复请求 Google Sheets
+M50_CACHE_PATH = os.getenv(
+    'M50_CACHE_PATH',
+    os.path.join(os.getenv('CLOUD_STORAGE_PATH', './data'), 'momentum50_cache.json')
+)
+M50_CACHE_TTL = 3600
+
+# Stockbee 页面中发现的 Sheets CSV 地址（很少变化），有效期内直接请求，跳过 Stockbee 页面
+M50_ENDPOINT_PATH = os.getenv(
+    'M50_ENDPOINT_PATH',
+    os.path.join(os.getenv('CLOUD_STORAGE_PATH', './data'), 'momentum50_endpoint.json')
+)
+M50_ENDPOINT_TTL = 7 * 24 * 3600
+
+# 复用的 HTTP 会话：Stockbee 页面和多次 Sheets 回退请求共用 keep-alive 连接
+session = requests.Session()
+session.headers.update(HEADERS)
+session.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=FETCH_CONCURRENCY,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504]),
+))
+
+
+def load_cached_result():
+    """读取未过期的抓取结果缓存，不存在或已过期返回 None"""
+    try:
+        if time.time() - os.path.getmtime(M50_CACHE_PATH) >= M50_CACHE_TTL:
+            return None
+        return read_json(M50_CACHE_PATH)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"读取 Momentum 50 缓存失败: {e}")
+        return None
+
+
+def save_cached_result(result: dict):
+    """保存抓取结果缓存"""
+    try:
+        write_json(M50_CACHE_PATH, result)
+    except Exception as e:
+        logger.warning(f"保存 Momentum 50 缓存失败: {e}")
+
+
+def load_known_endpoint():
+    """读取未过期的 Stockbee iframe CSV 地址，不存在或已过期返回 None"""
+    try:
+        endpoint = read_json(M50_ENDPOINT_PATH)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"读取 Momentum 50 数据源地址失败: {e}")
+        return None
+
+    if time.time() - endpoint.get('discovered_at', 0) >= M50_ENDPOINT_TTL:
+        return None
+    return endpoint.get('csv_url')
+
+
+def save_known_endpoint(csv_url: str):
+    """记录 Stockbee 页面中发现的 CSV 地址"""
+    try:
+        write_json(M50_ENDPOINT_PATH, {'csv_url': csv_url, 'discovered_at': time.time()})
+    except Exception as e:
+        logger.warning(f"保存 Momentum 50 数据源地址失败: {e}")
+
 
-def fetch_momentum50() -> dict:
+def fetch_momentum50(use_cache: bool = True) -> dict:
     """
     抓取 Momentum 50 数据
 
-    尝试多种方法获取数据:
+    M50_CACHE_TTL 内已抓取过时直接返回缓存结果（use_cache=False 时跳过，用于定时推送）；之前从 Stockbee 页面发现过 CSV 地址时
+    先直接请求该地址。都不可用时并发尝试多种方法获取数据，按以下优先级取第一个成功的结果:
     1. 从 Stockbee 页面获取 iframe 中的 Google Sheets URL
     2. 直接访问已知的 Google Sheets CSV 导出 URL
     3. 尝试 pubhtml 格式
+    4. 其他年份的 GID
 
     Returns:
         dict: {
             "date": "2026-02-03",
             "tickers": ["ANL", "GITS", "AZN", ...],  # 最新的50个
-            "history": {
+            "history": {  # 最近 HISTORY_DAYS 天
                 "02/03/2026": ["ANL", "GITS", ...],
                 "02/02/2026": ["TCGL", "ANL", ...],
                 ...
@@ -61,54 +175,66 @@ def fetch_momentum50() -> dict:
             "dropped": ["XYZ", "ABC"],  # 今天掉出榜单的
         }
     """
-    # 方法1: 从 Stockbee 页面获取 iframe URL
-    try:
-        logger.info("方法1: 尝试从 Stockbee 页面获取数据...")
-        result = fetch_from_stockbee_page()
+    cached = load_cached_result() if use_cache else None
+    if cached:
+        logger.info(f"使用 Momentum 50 缓存: {len(cached.get('tickers', []))} 个标的")
+        return cached
+
+    known_url = load_known_endpoint()
+    if known_url:
+        try:
+            result = fetch_from_csv_url(known_url)
+        except Exception as e:
+            logger.warning(f"已知数据源地址获取失败: {e}")
+            result = None
         if result and result.get('tickers'):
-            logger.info(f"从 Stockbee 页面获取成功: {len(result['tickers'])} 个标的")
+            result['source'] = 'stockbee_page'
+            logger.info(f"从已知数据源地址获取成功: {len(result['tickers'])} 个标的")
+            save_cached_result(result)
             return result
-    except Exception as e:
-        logger.warning(f"从 Stockbee 页面获取失败: {e}")
 
-    # 方法2: 直接尝试 CSV 导出（当前年份）
     current_year = str(datetime.now().year)
     gid = YEAR_GIDS.get(current_year, YEAR_GIDS.get("2026", "0"))
 
+    # 按优先级排列的获取方法: (说明, 函数, 参数)
+    attempts = [
+        # 方法1: 从 Stockbee 页面获取 iframe URL
+        ("Stockbee 页面", fetch_from_stockbee_page, ()),
+        # 方法2: 直接尝试 CSV 导出（当前年份）
+        (f"CSV 导出 (年份={current_year}, GID={gid})", fetch_from_csv_url,
+         (f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/export?format=csv&gid={gid}",)),
+        # 方法3: 尝试 pubhtml 格式
+        ("pubhtml", fetch_from_pubhtml,
+         (f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/pubhtml?gid={gid}",)),
+    ]
+    # 方法4: 尝试其他年份的 GID
+    attempts += [
+        (f"备用 GID (年份={year}, GID={alt_gid})", fetch_from_csv_url,
+         (f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/export?format=csv&gid={alt_gid}",))
+        for year, alt_gid in YEAR_GIDS.items()
+        if alt_gid != gid
+    ]
+
+    # 所有方法同时发起请求，再按优先级取第一个成功的结果，
+    # 总耗时取决于最慢的那个高优先级请求，而不是逐个超时累加
+    executor = ThreadPoolExecutor(max_workers=min(len(attempts), FETCH_CONCURRENCY))
     try:
-        logger.info(f"方法2: 尝试直接 CSV 导出 (年份={current_year}, GID={gid})...")
-        csv_url = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/export?format=csv&gid={gid}"
-        result = fetch_from_csv_url(csv_url)
-        if result and result.get('tickers'):
-            logger.info(f"从 CSV 导出获取成功: {len(result['tickers'])} 个标的")
-            return result
-    except Exception as e:
-        logger.warning(f"CSV 导出失败: {e}")
+        futures = [executor.submit(func, *args) for _, func, args in attempts]
 
-    # 方法3: 尝试 pubhtml 格式
-    try:
-        logger.info("方法3: 尝试 pubhtml 格式...")
-        pubhtml_url = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/pubhtml?gid={gid}"
-        result = fetch_from_pubhtml(pubhtml_url)
-        if result and result.get('tickers'):
-            logger.info(f"从 pubhtml 获取成功: {len(result['tickers'])} 个标的")
-            return result
-    except Exception as e:
-        logger.warning(f"pubhtml 格式失败: {e}")
+        for (name, _, _), future in zip(attempts, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.warning(f"{name} 获取失败: {e}")
+                continue
 
-    # 方法4: 尝试其他年份的 GID
-    for year, alt_gid in YEAR_GIDS.items():
-        if alt_gid == gid:
-            continue
-        try:
-            logger.info(f"方法4: 尝试备用 GID (年份={year}, GID={alt_gid})...")
-            csv_url = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/export?format=csv&gid={alt_gid}"
-            result = fetch_from_csv_url(csv_url)
             if result and result.get('tickers'):
-                logger.info(f"从备用 GID 获取成功: {len(result['tickers'])} 个标的")
+                logger.info(f"从 {name} 获取成功: {len(result['tickers'])} 个标的")
+                save_cached_result(result)
                 return result
-        except Exception as e:
-            logger.warning(f"备用 GID {alt_gid} 失败: {e}")
+    finally:
+        # 已拿到结果时不等待剩余请求
+        executor.shutdown(wait=False, cancel_futures=True)
 
     logger.error("所有 Momentum 50 数据获取方法都失败了")
     return None
@@ -118,68 +244,100 @@ def fetch_from_stockbee_page() -> dict:
     """
     从 Stockbee 页面获取嵌入的 Google Sheets URL
     """
-    response = requests.get(STOCKBEE_M50_URL, headers=HEADERS, timeout=30)
-    response.raise_for_status()
+    with session.get(STOCKBEE_M50_URL, timeout=30, stream=True) as response:
+        response.raise_for_status()
+
+        # 查找 Google Sheets iframe，找到可用的即停止下载页面剩余部分
+        for src in iter_sheet_iframes(response):
+            result = fetch_from_sheet_iframe(src)
+            if result:
+                return result
+
+    return None
 
-    soup = BeautifulSoup(response.text, 'html.parser')
 
-    # 查找 iframe
-    iframes = soup.find_all('iframe')
-    for iframe in iframes:
-        src = iframe.get('src', '')
-        if 'docs.google.com/spreadsheets' in src:
-            logger.info(f"找到 Google Sheets iframe: {src[:80]}...")
+def iter_sheet_iframes(response):
+    """
+    边下载边扫描页面中的 Google Sheets iframe src
 
-            # 提取 sheet ID 和 gid
-            sheet_id_match = re.search(r'/d/([a-zA-Z0-9_-]+)', src)
-            if not sheet_id_match:
-                sheet_id_match = re.search(r'/d/e/([a-zA-Z0-9_-]+)', src)
+    匹配紧贴已下载数据末尾时可能被截断，等下一块数据到达后再判断
+    """
+    buffer = b''
+    pos = 0
 
-            if sheet_id_match:
-                sheet_id = sheet_id_match.group(1)
-                gid_match = re.search(r'gid=(\d+)', src)
-                gid = gid_match.group(1) if gid_match else "0"
+    for chunk in response.iter_content(chunk_size=16 * 1024):
+        buffer += chunk
+        for match in SHEETS_IFRAME_RE.finditer(buffer, pos):
+            if match.end() == len(buffer):
+                break
+            pos = match.end()
+            yield html.unescape(match.group(1).decode('utf-8', errors='ignore'))
 
-                # 尝试 CSV 导出
-                csv_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
-                result = fetch_from_csv_url(csv_url)
-                if result:
-                    result['source'] = 'stockbee_page'
-                    return result
+    # 页面读完，补上最后一个紧贴末尾的匹配
+    for match in SHEETS_IFRAME_RE.finditer(buffer, pos):
+        yield html.unescape(match.group(1).decode('utf-8', errors='ignore'))
 
-    return None
+
+def fetch_from_sheet_iframe(src: str) -> dict:
+    """从 iframe src 中提取 sheet ID 和 gid，尝试 CSV 导出"""
+    logger.info(f"找到 Google Sheets iframe: {src[:80]}...")
+
+    # 提取 sheet ID 和 gid
+    sheet_id_match = SHEET_ID_RE.search(src)
+    if not sheet_id_match:
+        return None
+
+    sheet_id = sheet_id_match.group(1)
+    gid_match = GID_RE.search(src)
+    gid = gid_match.group(1) if gid_match else "0"
+
+    # 尝试 CSV 导出
+    csv_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
+    result = fetch_from_csv_url(csv_url)
+    if result:
+        result['source'] = 'stockbee_page'
+        save_known_endpoint(csv_url)
+    return result
 
 
 def fetch_from_csv_url(csv_url: str) -> dict:
     """
     从 Google Sheets CSV 导出 URL 获取数据
     """
-    response = requests.get(csv_url, headers=HEADERS, timeout=30)
-
-    # 检查是否是 CSV 内容
-    content_type = response.headers.get('content-type', '')
-    if response.status_code != 200:
-        logger.warning(f"CSV 请求失败: {response.status_code}")
-        return None
+    # 流式读取，只解析需要的前几行，读完即关闭连接
+    with session.get(csv_url, timeout=30, stream=True) as response:
+        if response.status_code != 200:
+            logger.warning(f"CSV 请求失败: {response.status_code}")
+            return None
 
-    if 'text/csv' not in content_type and 'text/plain' not in content_type:
-        # 可能是 HTML 错误页面
-        if 'html' in content_type.lower():
+        # 按内容判断是否是 CSV：Google 有时用 application/octet-stream 返回 CSV，
+        # 而未公开分享时返回的是 HTML 登录页
+        lines = response.iter_lines()
+        first_line = next(lines, b'')
+        if first_line.lstrip().startswith(b'<'):
             logger.warning("收到 HTML 而非 CSV，可能需要公开分享")
             return None
 
-    return parse_csv_content(response.text)
+        reader = csv.reader(codecs.iterdecode(chain((first_line,), lines), 'utf-8'))
+        rows = list(islice(reader, 51))  # 日期行 + 前50行数据
+
+    return parse_csv_content(rows)
 
 
 def fetch_from_pubhtml(pubhtml_url: str) -> dict:
     """
     从 Google Sheets pubhtml 格式获取数据
     """
-    response = requests.get(pubhtml_url, headers=HEADERS, timeout=30)
+    response = session.get(pubhtml_url, timeout=30)
     response.raise_for_status()
 
-    soup = BeautifulSoup(response.text, 'html.parser')
-    tables = soup.find_all('table')
+    # lxml 会先解析整个文档再遍历表格；BeautifulSoup 回退时用 SoupStrainer 只为表格建树。
+    # 找到有效的数据表即停止，不再对后面的表格提取单元格
+    if lxml_html is not None:
+        tables = lxml_html.fromstring(response.content).iter('table')
+    else:
+        soup = BeautifulSoup(response.content, 'html.parser', parse_only=TABLE_STRAINER)
+        tables = soup.find_all('table')
 
     for table in tables:
         result = parse_html_table(table)
@@ -190,73 +348,74 @@ def fetch_from_pubhtml(pubhtml_url: str) -> dict:
     return None
 
 
-def parse_csv_content(csv_text: str) -> dict:
+def diff_tickers(latest_tickers: list, prev_tickers: list = None) -> tuple:
+    """
+    计算新进入和掉出榜单的标的
+
+    Returns:
+        tuple: (new_entries, dropped)，没有前一日数据时均为空列表
+    """
+    if not prev_tickers:
+        return [], []
+
+    curr, prev = set(latest_tickers), set(prev_tickers)
+    return sorted(curr - prev), sorted(prev - curr)
+
+
+def parse_csv_content(rows: list) -> dict:
     """
     解析 CSV 内容
 
     预期格式:
     - 第一行是日期（列标题）
     - 后续行是各列对应的股票代码
-    """
-    reader = csv.reader(StringIO(csv_text))
-    rows = list(reader)
 
+    Args:
+        rows: csv.reader 解析出的行列表
+    """
     if len(rows) < 2:
         logger.warning("CSV 数据行数不足")
         return None
 
-    # 第一行是日期
-    dates = [d.strip() for d in rows[0] if d.strip()]
+    # 第一行是日期，只去一次空白
+    header = [d.strip() for d in rows[0]]
 
-    if not dates:
+    if not any(header):
         logger.warning("无法解析日期行")
         return None
 
-    # 构建历史数据
+    # 构建历史数据（按表头顺序插入，dict 保持列顺序）
     history = {}
-    for col_idx, date in enumerate(rows[0]):
-        if not date or date.strip() == "":
+    for col_idx, date in enumerate(header):
+        if not date:
             continue
 
-        date = date.strip()
         tickers = []
         for row in rows[1:51]:  # 获取前50行数据
             if col_idx < len(row) and row[col_idx]:
                 ticker = row[col_idx].strip().upper()
                 # 过滤无效的 ticker
-                if ticker and ticker != "" and is_valid_ticker(ticker):
+                if is_valid_ticker(ticker):
                     tickers.append(ticker)
 
         if tickers:
             history[date] = tickers
+            # 更早的列不会被用到，不再解析
+            if len(history) >= HISTORY_DAYS:
+                break
 
     if not history:
         logger.warning("未解析到有效数据")
         return None
 
     # 获取最新日期的数据（第一列）
-    first_valid_date = None
-    for date in rows[0]:
-        date = date.strip() if date else ""
-        if date and date in history:
-            first_valid_date = date
-            break
-
-    latest_date = first_valid_date
-    latest_tickers = history.get(latest_date, [])
+    sorted_dates = list(history)
+    latest_date = sorted_dates[0]
+    latest_tickers = history[latest_date]
 
     # 计算新进入和掉出
-    new_entries = []
-    dropped = []
-
-    sorted_dates = [d.strip() for d in rows[0] if d.strip() and d.strip() in history]
-    if len(sorted_dates) >= 2:
-        prev_date = sorted_dates[1]
-        prev_tickers = set(history.get(prev_date, []))
-        curr_tickers = set(latest_tickers)
-
-        new_entries = sorted(list(curr_tickers - prev_tickers))
-        dropped = sorted(list(prev_tickers - curr_tickers))
+    prev_tickers = history[sorted_dates[1]] if len(sorted_dates) >= 2 else None
+    new_entries, dropped = diff_tickers(latest_tickers, prev_tickers)
 
     return {
         "date": datetime.now().strftime("%Y-%m-%d"),
@@ -269,35 +428,57 @@ def parse_csv_content(csv_text: str) -> dict:
     }
 
 
+def table_cell_texts(table, max_rows: int = None) -> list:
+    """
+    提取表格每行各单元格的文本
+
+    Args:
+        table: lxml 元素或 BeautifulSoup Tag
+        max_rows: 最多提取的行数
+
+    Returns:
+        list: 每行一个单元格文本列表
+    """
+    if lxml_html is not None and isinstance(table, etree._Element):
+        return [
+            [cell.text_content().strip() for cell in CELLS_XP(row)]
+            for row in ROWS_XP(table)[:max_rows]
+        ]
+
+    return [
+        [cell.get_text(strip=True) for cell in row.find_all(['td', 'th'])]
+        for row in table.find_all('tr', limit=max_rows)
+    ]
+
+
 def parse_html_table(table) -> dict:
     """
     解析 HTML 表格（pubhtml 格式）
     """
-    rows = table.find_all('tr')
+    rows = table_cell_texts(table, max_rows=51)  # 表头 + 前50行数据
     if len(rows) < 2:
         return None
 
-    # 提取表头（日期）
-    header_row = rows[0]
-    dates = []
-    for cell in header_row.find_all(['td', 'th']):
-        text = cell.get_text(strip=True)
-        if text and re.match(r'\d{1,2}/\d{1,2}/\d{4}', text):
-            dates.append(text)
+    # 提取表头（日期）: 列号 → 日期，只取最近 HISTORY_DAYS 天
+    date_columns = [
+        (col_idx, text) for col_idx, text in enumerate(rows[0])
+        if text and DATE_RE.match(text)
+    ][:HISTORY_DAYS]
 
-    if not dates:
+    if not date_columns:
         return None
 
-    # 构建历史数据
+    dates = [date for _, date in date_columns]
+
+    # 构建历史数据（只读取日期列，其余单元格不做校验）
     history = {date: [] for date in dates}
 
-    for row in rows[1:51]:  # 前50行数据
-        cells = row.find_all(['td', 'th'])
-        for col_idx, cell in enumerate(cells):
-            if col_idx < len(dates):
-                text = cell.get_text(strip=True).upper()
-                if text and is_valid_ticker(text):
-                    history[dates[col_idx]].append(text)
+    for row in rows[1:]:
+        for col_idx, date in date_columns:
+            if col_idx < len(row):
+                text = row[col_idx].upper()
+                if is_valid_ticker(text):
+                    history[date].append(text)
 
     # 过滤空列表
     history = {k: v for k, v in history.items() if v}
@@ -309,14 +490,8 @@ def parse_html_table(table) -> dict:
     latest_tickers = history.get(latest_date, [])
 
     # 计算新进入和掉出
-    new_entries = []
-    dropped = []
-
-    if len(dates) >= 2 and dates[1] in history:
-        prev_tickers = set(history[dates[1]])
-        curr_tickers = set(latest_tickers)
-        new_entries = sorted(list(curr_tickers - prev_tickers))
-        dropped = sorted(list(prev_tickers - curr_tickers))
+    prev_tickers = history.get(dates[1]) if len(dates) >= 2 else None
+    new_entries, dropped = diff_tickers(latest_tickers, prev_tickers)
 
     return {
         "date": datetime.now().strftime("%Y-%m-%d"),
@@ -332,16 +507,12 @@ def is_valid_ticker(ticker: str) -> bool:
     """
     验证是否是有效的股票代码
     """
-    if not ticker or len(ticker) > 6:
-        return False
-    # 股票代码通常是1-5个大写字母，可能带数字
-    if not re.match(r'^[A-Z]{1,5}[A-Z0-9]*$', ticker):
-        return False
-    # 排除常见的非股票代码
-    invalid_patterns = ['DATE', 'TICKER', 'STOCK', 'NAME', 'N/A', 'NA', 'NULL']
-    if ticker in invalid_patterns:
-        return False
-    return True
+    # 由便宜到昂贵：长度 → 集合查找 → 正则
+    return (
+        0 < len(ticker) <= 6
+        and ticker not in INVALID_TICKERS
+        and TICKER_RE.fullmatch(ticker) is not None
+    )
 
 
 def get_tradingview_watchlist(tickers: list) -> str:
@@ -355,14 +526,14 @@ def get_tradingview_watchlist(tickers: list) -> str:
     Returns:
         str: TradingView 格式的 watchlist
     """
-    # TradingView 格式：每行一个代码，或者逗号分隔
-    # 添加 NASDAQ/NYSE 前缀
-    formatted = []
-    for ticker in tickers:
-        # 默认使用 NASDAQ，大部分 momentum 股票在 NASDAQ
-        formatted.append(f"NASDAQ:{ticker}")
+    return _tradingview_watchlist(tuple(tickers))
 
-    return ",".join(formatted)
+
+@lru_cache(maxsize=16)
+def _tradingview_watchlist(tickers: tuple) -> str:
+    # TradingView 格式：每行一个代码，或者逗号分隔
+    # 添加 NASDAQ/NYSE 前缀，默认使用 NASDAQ，大部分 momentum 股票在 NASDAQ
+    return ",".join(f"NASDAQ:{ticker}" for ticker in tickers)
 
 
 def get_ticker_info_prompt(tickers: list) -> str:
@@ -434,12 +605,12 @@ def analyze_momentum_changes(data: dict) -> dict:
 
     # 检查历史连续性
     if data.get("history"):
-        dates = sorted(data["history"].keys(), reverse=True)
+        # history 按表头顺序排列，最新日期在前
+        dates = list(data["history"])[:3]
         if len(dates) >= 3:
-            # 检查最近3天都在榜单的股票（持续强势）
-            persistent = set(data["history"][dates[0]])
-            for date in dates[1:3]:
-                persistent &= set(data["history"][date])
+            # 检查最近3天都在榜单的股票（持续强势），一次求交集
+            latest, *earlier = (data["history"][date] for date in dates)
+            persistent = set(latest).intersection(*earlier)
 
             analysis["persistent_leaders"] = list(persistent)[:10]
 
@@ -9,11 +9,14 @@ AI Analyzer - 支持多个大模型提供商
 """
 
 import os
+import re
 import time
+import random
 import logging
-from datetime import datetime, timedelta
-from functools import wraps
-import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from utils.json_io import read_json, write_json
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +29,23 @@ GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 # 默认提供商优先级
 DEFAULT_PROVIDER = os.getenv('AI_PROVIDER', 'gemini')  # gemini 或 zhipu
 
+# 标的简介持久化文件（/status 直接查表，无需调用 AI）
+TICKER_DESC_PATH = os.getenv(
+    'TICKER_DESC_PATH',
+    os.path.join(os.getenv('CLOUD_STORAGE_PATH', './data'), 'ticker_descriptions.json')
+)
+
+# 分析结果缓存时间（秒）：相同数据生成的提示词相同，重复推送直接复用
+ANALYSIS_CACHE_TTL = 30 * 60
+
+# 标的简介每次 AI 调用的数量及并发批次数
+# 每条简介只有一行，50 个以内一次调用即可，超出时才分批
+TICKER_DESC_CHUNK_SIZE = 50
+TICKER_DESC_CONCURRENCY = 3
+
+# 简介回复的每一行 "TICKER: 简介"（兼容全角冒号），整段回复一次匹配
+TICKER_DESC_RE = re.compile(r'^\s*([A-Za-z][A-Za-z0-9.\-]{0,9})\s*[:：]\s*(.*?)\s*$', re.MULTILINE)
+
 # ============== 限流配置 ==============
 RATE_LIMIT = {
     "zhipu": {
@@ -38,11 +58,8 @@ RATE_LIMIT = {
     }
 }
 
-# 请求计数器
-request_counter = {
-    "zhipu": {"count": 0, "last_reset": datetime.now(), "last_request": None},
-    "gemini": {"count": 0, "last_reset": datetime.now(), "last_request": None}
-}
+# 排队等待令牌的最长时间（秒），超过则放弃本次请求
+MAX_RATE_WAIT = 60
 
 
 class RateLimitExceeded(Exception):
@@ -50,53 +67,139 @@ class RateLimitExceeded(Exception):
     pass
 
 
-def check_rate_limit_sync(provider: str):
-    """同步检查限流"""
-    config = RATE_LIMIT.get(provider, RATE_LIMIT["zhipu"])
-    counter = request_counter.get(provider, request_counter["zhipu"])
-
-    # 重置每分钟计数
-    if datetime.now() - counter["last_reset"] > timedelta(minutes=1):
-        counter["count"] = 0
-        counter["last_reset"] = datetime.now()
-
-    # 检查每分钟限制
-    if counter["count"] >= config["requests_per_minute"]:
-        raise RateLimitExceeded(f"{provider} 每分钟请求限制已达到")
-
-    # 检查冷却时间
-    if counter["last_request"]:
-        elapsed = (datetime.now() - counter["last_request"]).total_seconds()
-        if elapsed < config["cooldown_seconds"]:
-            wait_time = config["cooldown_seconds"] - elapsed
+class TokenBucket:
+    """
+    令牌桶限流（线程安全）
+
+    - 每分钟补充 rate_per_minute 个令牌，桶容量同为 rate_per_minute
+    - 相邻两次请求至少间隔 cooldown_seconds
+    - 在锁内预占令牌和时间片，锁外睡眠，并发调用者按顺序排队
+    """
+
+    def __init__(self, name: str, rate_per_minute: int, cooldown_seconds: float):
+        self.name = name
+        self.capacity = rate_per_minute
+        self.refill_rate = rate_per_minute / 60
+        self.cooldown = cooldown_seconds
+        self.tokens = float(rate_per_minute)
+        self.last_refill = time.monotonic()
+        self.next_allowed = 0.0
+        self.total_wait = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """获取一个令牌，必要时阻塞等待；需要等待超过 MAX_RATE_WAIT 时抛出 RateLimitExceeded"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_rate)
+            self.last_refill = now
+
+            # 令牌不足时要等到补满一个（tokens 可能因预占为负）
+            token_at = now if self.tokens >= 1 else now + (1 - self.tokens) / self.refill_rate
+            start = max(token_at, self.next_allowed)
+            wait_time = start - now
+            if wait_time > MAX_RATE_WAIT:
+                raise RateLimitExceeded(f"{self.name} 每分钟请求限制已达到")
+
+            self.tokens -= 1
+            self.next_allowed = start + self.cooldown
+            self.total_wait += max(wait_time, 0)
+
+        if wait_time > 0:
             logger.debug(f"等待冷却: {wait_time:.1f}秒")
             time.sleep(wait_time)
 
-    # 更新计数器
-    counter["count"] += 1
-    counter["last_request"] = datetime.now()
+    def estimated_wait(self) -> float:
+        """估算现在获取令牌需要等待的秒数（不占用令牌）"""
+        with self.lock:
+            now = time.monotonic()
+            tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_rate)
+            token_at = now if tokens >= 1 else now + (1 - tokens) / self.refill_rate
+            return max(token_at, self.next_allowed) - now
+
+    def penalize(self, seconds: float):
+        """服务端返回限流时推迟之后的所有请求（包括其他线程排队中的请求）"""
+        with self.lock:
+            self.next_allowed = max(self.next_allowed, time.monotonic() + seconds)
+
+
+rate_limiters = {
+    provider: TokenBucket(provider, config["requests_per_minute"], config["cooldown_seconds"])
+    for provider, config in RATE_LIMIT.items()
+}
+
+
+# 各提供商调用结果计数（进程内累计）
+ai_stats = {
+    provider: {"success": 0, "rate_limited": 0, "error": 0}
+    for provider in RATE_LIMIT
+}
+ai_stats_lock = threading.Lock()
+
+
+def record_ai_stat(provider: str, outcome: str):
+    """计数加一（调用在线程池中并发执行，需加锁）"""
+    with ai_stats_lock:
+        ai_stats[provider][outcome] += 1
+
+
+def format_ai_stats() -> str:
+    """汇总 AI 调用次数、限流等待时间和结果缓存命中情况"""
+    from utils.llm_cache import cache_stats
+
+    parts = [
+        f"{provider} 成功{stats['success']}/限流{stats['rate_limited']}/失败{stats['error']}"
+        f"/限流等待{rate_limiters[provider].total_wait:.0f}秒"
+        for provider, stats in ai_stats.items()
+    ]
+    parts.append(f"缓存命中{cache_stats['hits']}/未命中{cache_stats['misses']}")
+    return "AI 调用统计: " + ", ".join(parts)
+
+
+def check_rate_limit_sync(provider: str):
+    """同步检查限流"""
+    rate_limiters.get(provider, rate_limiters["zhipu"]).acquire()
+
+
+def retry_after_seconds(error: Exception):
+    """从限流异常附带的 HTTP 响应中读取 Retry-After（秒），没有时返回 None"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
 
 
 # ============== 智谱 AI (GLM) ==============
 
 zhipu_client = None
+# 初始化状态: None=未尝试, True=可用, False=不可用（缺少配置或依赖，不再重试）
+zhipu_ready = None
 
 
 def init_zhipu():
     """初始化智谱 AI"""
-    global zhipu_client
+    global zhipu_client, zhipu_ready
+
+    if zhipu_ready is not None:
+        return zhipu_ready
 
     if not ZHIPU_API_KEY:
         logger.warning("未配置 ZHIPU_API_KEY")
+        zhipu_ready = False
         return False
 
     try:
         from zhipuai import ZhipuAI
         zhipu_client = ZhipuAI(api_key=ZHIPU_API_KEY)
         logger.info("智谱 AI 初始化成功")
+        zhipu_ready = True
         return True
     except ImportError:
         logger.error("请安装 zhipuai: pip install zhipuai")
+        zhipu_ready = False
         return False
     except Exception as e:
         logger.error(f"智谱 AI 初始化失败: {e}")
@@ -135,24 +238,29 @@ def analyze_with_zhipu(prompt: str, max_retries: int = 3) -> str:
 
             result = response.choices[0].message.content
             logger.info(f"智谱分析成功 (尝试 {attempt + 1})")
+            record_ai_stat("zhipu", "success")
             return result
 
         except RateLimitExceeded as e:
             logger.warning(f"智谱速率限制: {e}")
+            record_ai_stat("zhipu", "rate_limited")
             return None
 
         except Exception as e:
             error_msg = str(e).lower()
 
-            # 速率限制错误
+            # 速率限制错误：优先按服务端 Retry-After 等待，否则随机退避（full jitter），
+            # 由令牌桶统一推迟，避免并发请求同时重试
             if "rate" in error_msg or "quota" in error_msg or "429" in str(e):
-                wait_time = 10 * (attempt + 1)
-                logger.warning(f"智谱 API 限制，等待 {wait_time} 秒")
-                time.sleep(wait_time)
+                wait_time = retry_after_seconds(e) or random.uniform(0, min(MAX_RATE_WAIT, 5 * 2 ** attempt))
+                logger.warning(f"智谱 API 限制，等待 {wait_time:.1f} 秒")
+                record_ai_stat("zhipu", "rate_limited")
+                rate_limiters["zhipu"].penalize(wait_time)
                 continue
 
             # 其他错误
             logger.error(f"智谱调用失败 (尝试 {attempt + 1}/{max_retries}): {e}")
+            record_ai_stat("zhipu", "error")
             if attempt == max_retries - 1:
                 return None
 
@@ -164,22 +272,37 @@ def analyze_with_zhipu(prompt: str, max_retries: int = 3) -> str:
 # ============== Gemini API (备选) ==============
 
 gemini_model = None
+# 初始化状态: None=未尝试, True=可用, False=不可用（缺少配置或依赖，不再重试）
+gemini_ready = None
+# Gemini 限流异常类型（随 SDK 在 init_gemini 中导入，未初始化时为空元组）
+gemini_rate_errors = ()
 
 
 def init_gemini():
     """初始化 Gemini"""
-    global gemini_model
+    global gemini_model, gemini_ready, gemini_rate_errors
+
+    if gemini_ready is not None:
+        return gemini_ready
 
     if not GEMINI_API_KEY:
         logger.warning("未配置 GEMINI_API_KEY")
+        gemini_ready = False
         return False
 
     try:
         import google.generativeai as genai
+        from google.api_core.exceptions import ResourceExhausted
+        gemini_rate_errors = (ResourceExhausted,)
         genai.configure(api_key=GEMINI_API_KEY)
         gemini_model = genai.GenerativeModel('gemini-2.0-flash')
         logger.info("Gemini 初始化成功")
+        gemini_ready = True
         return True
+    except ImportError:
+        logger.error("请安装 google-generativeai: pip install google-generativeai")
+        gemini_ready = False
+        return False
     except Exception as e:
         logger.error(f"Gemini 初始化失败: {e}")
         return False
@@ -202,19 +325,21 @@ def analyze_with_gemini(prompt: str, max_retries: int = 2) -> str:
         try:
             check_rate_limit_sync("gemini")
             response = gemini_model.generate_content(prompt)
+            record_ai_stat("gemini", "success")
             return response.text
 
         except RateLimitExceeded:
+            record_ai_stat("gemini", "rate_limited")
             return None
 
-        except Exception as e:
-            error_msg = str(e).lower()
-
-            if "rate" in error_msg or "quota" in error_msg or "429" in error_msg:
-                logger.warning(f"Gemini API 限制")
-                return None
+        except gemini_rate_errors:
+            logger.warning(f"Gemini API 限制")
+            record_ai_stat("gemini", "rate_limited")
+            return None
 
+        except Exception as e:
             logger.error(f"Gemini 调用失败: {e}")
+            record_ai_stat("gemini", "error")
             if attempt == max_retries - 1:
                 return None
 
@@ -225,7 +350,12 @@ def analyze_with_gemini(prompt: str, max_retries: int = 2) -> str:
 
 # ============== 统一分析入口 ==============
 
-def analyze(prompt: str, prefer: str = None) -> str:
+# 正在请求中的可缓存提示词: 缓存键 -> Future
+inflight_requests = {}
+inflight_lock = threading.Lock()
+
+
+def analyze(prompt: str, prefer: str = None, cache_ttl: int = None) -> str:
     """
     统一 AI 分析入口，自动选择可用的提供商
 
@@ -237,12 +367,56 @@ def analyze(prompt: str, prefer: str = None) -> str:
     Args:
         prompt: 分析提示词
         prefer: 优先使用的提供商 (可选)
+        cache_ttl: 结果磁盘缓存时间（秒），None 表示不缓存
 
     Returns:
         str: 分析结果，如果所有提供商都失败则返回 None
     """
+    if cache_ttl is None:
+        return _analyze(prompt, prefer)
+
+    from utils.llm_cache import make_key, get_cached, set_cached
+
+    cache_key = make_key("analyze", prompt)
+    cached = get_cached(cache_key, ttl=cache_ttl)
+    if cached:
+        return cached
+
+    # 相同提示词已有线程在请求时直接等待其结果，不重复调用 AI
+    with inflight_lock:
+        future = inflight_requests.get(cache_key)
+        leader = future is None
+        if leader:
+            future = inflight_requests[cache_key] = Future()
+
+    if not leader:
+        return future.result()
+
+    result = None
+    try:
+        result = _analyze(prompt, prefer)
+        if result:
+            set_cached(cache_key, result)
+    finally:
+        with inflight_lock:
+            del inflight_requests[cache_key]
+        future.set_result(result)
+    return result
+
+
+def _analyze(prompt: str, prefer: str = None) -> str:
+    """依次尝试各提供商（不经过缓存）"""
     provider = prefer or DEFAULT_PROVIDER
 
+    # 首选提供商排队已超过 MAX_RATE_WAIT（必然被限流）时，直接先用另一个
+    other = "gemini" if provider == "zhipu" else "zhipu"
+    if (provider in rate_limiters
+            and (GEMINI_API_KEY if other == "gemini" else ZHIPU_API_KEY)
+            and rate_limiters[provider].estimated_wait() > MAX_RATE_WAIT
+            and rate_limiters[other].estimated_wait() <= MAX_RATE_WAIT):
+        logger.info(f"{provider} 限流排队已满，优先使用 {other}")
+        provider = other
+
     # 尝试主要提供商
     if provider == "zhipu" and ZHIPU_API_KEY:
         result = analyze_with_zhipu(prompt)
@@ -274,6 +448,77 @@ def analyze(prompt: str, prefer: str = None) -> str:
 
 # ============== 专用分析函数 ==============
 
+# 提示词中固定的说明部分放在前面、每次变化的数据放在最后，
+# 保证不同调用之间前缀一致，便于提供商侧的前缀缓存命中
+
+MARKET_BREADTH_PROMPT = """分析美股市场宽度数据，直接输出结论，不要开场白。
+
+输出格式（严格遵守，每行末尾不要句号）：
+1. 短期：[偏强/偏弱/震荡] - [简洁原因，用"个股"而非"股票"]
+2. 中期：[偏强/偏弱] - [基于季度数据的简洁判断]
+3. 信号：[无极端信号 或 具体信号]
+4. 建议：[观望/积极/减仓] - [简洁建议，15字以内]
+
+极端信号规则：
+- 季涨25%+<350：底部区域
+- 日涨4%+>1000且5日比>2：过热
+
+示例输出：
+1. 短期：偏弱 - 跌4%+个股数量明显多于涨4%+，5日比小于1，短期市场承压
+2. 中期：偏强 - 季度上涨个股数量超过下跌个股数量
+3. 信号：无极端信号
+4. 建议：观望 - 短期市场偏弱，不建议追高，等待企稳信号，控制仓位
+
+数据：
+"""
+
+MOMENTUM_PROMPT = """你是专业的美股动量交易分析师。分析下面的 Momentum 50 榜单。
+
+请提供简洁分析（适合手机阅读）：
+1. 行业分布：哪些板块占主导（1-2句）
+2. 新进标的点评：每个新进标的一句话（公司简介+关注点）
+   格式: TICKER：[公司简介10字]。关注点：[看点]
+
+要求：
+- 如果不了解某只股票，写"未知"即可，不要编造
+- 直接输出，不要开场白
+
+榜单：
+"""
+
+TICKER_DESC_PROMPT = """请为下面列出的美股标的提供简短介绍（每个10-15字，只写主营业务）。
+
+格式（严格遵守）：
+TICKER: 简介
+
+示例：
+AAPL: iPhone及消费电子巨头
+NVDA: AI芯片龙头，GPU领导者
+
+如果不了解某只股票，写 "TICKER: 未知" 即可。
+只输出格式化结果，不要其他内容。
+
+标的：
+"""
+
+
+# 表示缺失的单元格取值
+MISSING_VALUES = (None, 'N/A', '', 'null')
+
+
+def safe_num(val, default=0, is_float=False):
+    """安全获取数值（已是目标类型时直接返回）"""
+    target = float if is_float else int
+    if type(val) is target:
+        return val
+    if val in MISSING_VALUES:
+        return default
+    try:
+        return target(val)
+    except (ValueError, TypeError):
+        return default
+
+
 def analyze_market_breadth(data: dict) -> str:
     """
     分析市场宽度数据
@@ -283,15 +528,6 @@ def analyze_market_breadth(data: dict) -> str:
 
     latest = data["latest"]
 
-    # 安全获取数值
-    def safe_num(val, default=0, is_float=False):
-        if val in [None, 'N/A', '', 'null']:
-            return default
-        try:
-            return float(val) if is_float else int(val)
-        except (ValueError, TypeError):
-            return default
-
     up_4pct = safe_num(latest.get('up_4pct'), 0)
     down_4pct = safe_num(latest.get('down_4pct'), 0)
     ratio_5d = safe_num(latest.get('ratio_5d'), 1.0, is_float=True)
@@ -299,29 +535,15 @@ def analyze_market_breadth(data: dict) -> str:
     up_25pct_qtr = safe_num(latest.get('up_25pct_qtr'), 0)
     down_25pct_qtr = safe_num(latest.get('down_25pct_qtr'), 0)
 
-    prompt = f"""分析美股市场宽度数据，直接输出结论，不要开场白：
-
-【短期指标】日涨4%+: {up_4pct} | 日跌4%+: {down_4pct} | 5日比: {ratio_5d} | 10日比: {ratio_10d}
-【中期指标】季涨25%+: {up_25pct_qtr} | 季跌25%+: {down_25pct_qtr}
-
-输出格式（严格遵守，每行末尾不要句号）：
-1. 短期：[偏强/偏弱/震荡] - [简洁原因，用"个股"而非"股票"]
-2. 中期：[偏强/偏弱] - [基于季度数据的简洁判断]
-3. 信号：[无极端信号 或 具体信号]
-4. 建议：[观望/积极/减仓] - [简洁建议，15字以内]
-
-极端信号规则：
-- 季涨25%+<350：底部区域
-- 日涨4%+>1000且5日比>2：过热
+    # 各项指标方向一致时规则分析的结论与 AI 相同，直接返回，省一次 AI 调用
+    if is_clear_market_regime(up_4pct, down_4pct, ratio_5d, up_25pct_qtr, down_25pct_qtr):
+        return rule_based_market_analysis(up_4pct, down_4pct, ratio_5d, ratio_10d, up_25pct_qtr, down_25pct_qtr)
 
-示例输出：
-1. 短期：偏弱 - 跌4%+个股数量明显多于涨4%+，5日比小于1，短期市场承压
-2. 中期：偏强 - 季度上涨个股数量超过下跌个股数量
-3. 信号：无极端信号
-4. 建议：观望 - 短期市场偏弱，不建议追高，等待企稳信号，控制仓位"""
+    prompt = MARKET_BREADTH_PROMPT + f"""【短期指标】日涨4%+: {up_4pct} | 日跌4%+: {down_4pct} | 5日比: {ratio_5d:.2f} | 10日比: {ratio_10d:.2f}
+【中期指标】季涨25%+: {up_25pct_qtr} | 季跌25%+: {down_25pct_qtr}"""
 
     # 尝试 AI 分析
-    ai_result = analyze(prompt)
+    ai_result = analyze(prompt, cache_ttl=ANALYSIS_CACHE_TTL)
 
     if ai_result:
         return ai_result
@@ -330,6 +552,23 @@ def analyze_market_breadth(data: dict) -> str:
     return rule_based_market_analysis(up_4pct, down_4pct, ratio_5d, ratio_10d, up_25pct_qtr, down_25pct_qtr)
 
 
+def is_clear_market_regime(up_4pct, down_4pct, ratio_5d, up_25pct_qtr, down_25pct_qtr) -> bool:
+    """
+    判断市场是否处于明确的单边状态（规则分析足以给出结论）
+
+    短期涨跌个股差距明显、5日比同向、季度数据同向，且没有需要解读的极端信号
+    """
+    # 极端信号需要 AI 结合上下文解读
+    if 0 < up_25pct_qtr < 350 or (up_4pct > 1000 and ratio_5d > 2):
+        return False
+
+    if up_4pct > down_4pct * 1.5:
+        return ratio_5d > 1.2 and up_25pct_qtr > down_25pct_qtr
+    if down_4pct > up_4pct * 1.5:
+        return ratio_5d < 1 and down_25pct_qtr >= up_25pct_qtr
+    return False
+
+
 def rule_based_market_analysis(up_4pct, down_4pct, ratio_5d, ratio_10d, up_25pct_qtr, down_25pct_qtr) -> str:
     """规则分析 Market Monitor"""
     parts = []
@@ -382,24 +621,13 @@ def analyze_momentum_stocks(data: dict, include_descriptions: bool = True) -> st
     new_list = ", ".join(new_entries[:10]) if new_entries else "无"
     dropped_list = ", ".join(dropped[:10]) if dropped else "无"
 
-    prompt = f"""你是专业的美股动量交易分析师。分析以下 Momentum 50 榜单：
-
-日期: {data.get('latest_date', 'N/A')}
+    prompt = MOMENTUM_PROMPT + f"""日期: {data.get('latest_date', 'N/A')}
 榜单前20: {ticker_list}
 今日新进入: {new_list}
-今日掉出: {dropped_list}
-
-请提供简洁分析（适合手机阅读）：
-1. 行业分布：哪些板块占主导（1-2句）
-2. 新进标的点评：每个新进标的一句话（公司简介+关注点）
-   格式: TICKER：[公司简介10字]。关注点：[看点]
-
-要求：
-- 如果不了解某只股票，写"未知"即可，不要编造
-- 直接输出，不要开场白"""
+今日掉出: {dropped_list}"""
 
     # 尝试 AI 分析
-    ai_result = analyze(prompt)
+    ai_result = analyze(prompt, cache_ttl=ANALYSIS_CACHE_TTL)
 
     if ai_result:
         return ai_result
@@ -427,8 +655,7 @@ def rule_based_momentum_analysis(data: dict) -> str:
     # 新进标的
     parts.append("\n2. 新进标的点评：")
     if new_entries:
-        for ticker in new_entries[:10]:
-            parts.append(f"{ticker}：需要进一步研究。关注点：新进榜单，关注突破形态")
+        parts.extend(f"{ticker}：需要进一步研究。关注点：新进榜单，关注突破形态" for ticker in new_entries[:10])
     else:
         parts.append("今日无新进入标的")
 
@@ -443,45 +670,100 @@ def rule_based_momentum_analysis(data: dict) -> str:
     return "\n".join(parts)
 
 
-def get_ticker_descriptions(tickers: list) -> dict:
-    """
-    批量获取股票简介
-    """
-    if not tickers:
-        return {}
+# ============== 标的简介表 ==============
 
-    ticker_list = ", ".join(tickers[:15])
+ticker_desc_cache = None
 
-    prompt = f"""请为以下美股标的提供简短介绍（每个10-15字，只写主营业务）：
 
-{ticker_list}
+def load_ticker_descriptions() -> dict:
+    """读取标的简介表（首次读取后常驻内存）"""
+    global ticker_desc_cache
 
-格式（严格遵守）：
-TICKER: 简介
+    if ticker_desc_cache is None:
+        try:
+            ticker_desc_cache = read_json(TICKER_DESC_PATH)
+        except FileNotFoundError:
+            ticker_desc_cache = {}
+        except Exception as e:
+            logger.warning(f"读取标的简介表失败: {e}")
+            ticker_desc_cache = {}
 
-示例：
-AAPL: iPhone及消费电子巨头
-NVDA: AI芯片龙头，GPU领导者
+    return ticker_desc_cache
 
-如果不了解某只股票，写 "TICKER: 未知" 即可。
-只输出格式化结果，不要其他内容。"""
+
+def save_ticker_descriptions(descriptions: dict):
+    """合并并保存标的简介（"未知" 不入表）"""
+    known = {t.upper(): d for t, d in descriptions.items() if d and d != "未知"}
+    if not known:
+        return
+
+    cache = load_ticker_descriptions()
+    cache.update(known)
+
+    try:
+        write_json(TICKER_DESC_PATH, cache, indent=True)
+    except Exception as e:
+        logger.warning(f"保存标的简介表失败: {e}")
+
+
+def lookup_ticker_description(ticker: str):
+    """查询单个标的简介，未收录返回 None"""
+    return load_ticker_descriptions().get(ticker.upper())
+
+
+def _describe_tickers_chunk(tickers: list) -> dict:
+    """调用一次 AI 获取一批股票的简介"""
+    # 排序后同一批标的无论传入顺序如何都生成相同的提示词
+    ticker_list = ", ".join(sorted(tickers))
+
+    prompt = TICKER_DESC_PROMPT + ticker_list
 
     result = analyze(prompt)
 
     descriptions = {}
     if result:
-        for line in result.strip().split('\n'):
-            if ':' in line:
-                parts = line.split(':', 1)
-                ticker = parts[0].strip().upper()
-                desc = parts[1].strip() if len(parts) > 1 else "未知"
-                if ticker in [t.upper() for t in tickers]:
-                    descriptions[ticker] = desc
+        wanted = {t.upper() for t in tickers}
+        for match in TICKER_DESC_RE.finditer(result):
+            ticker = match.group(1).upper()
+            if ticker in wanted:
+                descriptions[ticker] = match.group(2)
+
+    return descriptions
+
+
+def get_ticker_descriptions(tickers: list) -> dict:
+    """
+    批量获取股票简介
+
+    已收录在简介表中的标的直接返回，未收录的按 TICKER_DESC_CHUNK_SIZE 分批并发调用 AI
+    """
+    if not tickers:
+        return {}
+
+    # 统一大写并去重（保持顺序），重复的标的不会占用批次名额
+    tickers = list(dict.fromkeys(t.upper() for t in tickers))
+
+    known = load_ticker_descriptions()
+    descriptions = {t: known[t] for t in tickers if t in known}
+    tickers = [t for t in tickers if t not in descriptions]
+    if not tickers:
+        return descriptions
+
+    # 单次提示词过长会被截断，分批获取，批次间并发（限流由 check_rate_limit_sync 保证）
+    chunks = [
+        tickers[i:i + TICKER_DESC_CHUNK_SIZE]
+        for i in range(0, len(tickers), TICKER_DESC_CHUNK_SIZE)
+    ]
+    with ThreadPoolExecutor(max_workers=TICKER_DESC_CONCURRENCY) as executor:
+        for chunk_descriptions in executor.map(_describe_tickers_chunk, chunks):
+            descriptions.update(chunk_descriptions)
+
+    save_ticker_descriptions(descriptions)
 
     # 填充未获取到的
     for ticker in tickers:
-        if ticker.upper() not in descriptions:
-            descriptions[ticker.upper()] = "未知"
+        if ticker not in descriptions:
+            descriptions[ticker] = "未知"
 
     return descriptions
 
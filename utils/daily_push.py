@@ -6,15 +6,20 @@ Daily Push Module
 
 import os
 import logging
-from datetime import datetime
+from datetime import datetime, date
+from functools import lru_cache
 from pathlib import Path
 import asyncio
 import base64
+import hashlib
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Telegram
-from telegram import Bot
 from telegram.constants import ParseMode
+from telegram.ext import AIORateLimiter, ExtBot
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +32,12 @@ GITHUB_BRANCH = os.getenv('GITHUB_BRANCH', 'main')
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 
+# 推送与 bot.py 的 Application 共用的 Telegram 限流器（全局 + 单聊天限速，429 时按 retry_after 重试）
+telegram_rate_limiter = AIORateLimiter(max_retries=3)
+
+# 推送共用的 Telegram Bot（复用 HTTP 连接池，首次发送时创建）
+telegram_bot = None
+
 # Obsidian 配置
 # 注意：这是 iCloud 路径，云端无法直接访问
 # 需要通过其他方式同步（如 GitHub、Dropbox API 等）
@@ -38,12 +49,32 @@ OBSIDIAN_VAULT_PATH = os.getenv(
 # 文件存储路径（云端临时存储）
 CLOUD_STORAGE_PATH = os.getenv('CLOUD_STORAGE_PATH', './data')
 
+# 单个推送流程的超时时间（秒）
+PUSH_TIMEOUT = int(os.getenv('PUSH_TIMEOUT', '600'))
+
+
+# 日期格式（文件名 / 消息标题）
+DATE_FORMAT = "%Y-%m-%d"
+
 
+@lru_cache(maxsize=1)
+def _format_day(ordinal: int) -> str:
+    """按天缓存日期字符串，一天只格式化一次"""
+    return date.fromordinal(ordinal).strftime(DATE_FORMAT)
+
+
+def today_str() -> str:
+    """今天的日期字符串 (YYYY-MM-DD)"""
+    return _format_day(date.today().toordinal())
+
+
+@lru_cache(maxsize=1)
 def ensure_dirs():
-    """确保必要的目录存在"""
+    """确保必要的目录存在（进程内只创建一次）"""
     dirs = [
         f"{CLOUD_STORAGE_PATH}/MarketMonitor",
         f"{CLOUD_STORAGE_PATH}/Momentum50",
+        f"{CLOUD_STORAGE_PATH}/GmailBrief",
         f"{CLOUD_STORAGE_PATH}/Archives",
     ]
     for d in dirs:
@@ -52,34 +83,36 @@ def ensure_dirs():
 
 # ============== MD 生成 ==============
 
-def generate_market_monitor_md(data: dict, analysis: str) -> str:
+def format_market_monitor_row(row: dict) -> str:
+    """Market Monitor 表格的一行"""
+    return (
+        f"| {row.get('date', '')} | {row.get('up_4pct', '')} | "
+        f"{row.get('down_4pct', '')} | {row.get('ratio_5d', '')} | "
+        f"{row.get('ratio_10d', '')} |"
+    )
+
+
+def generate_market_monitor_md(data: dict, analysis: str, now: datetime = None) -> str:
     """
     生成 Market Monitor Markdown 文档
 
     Args:
         data: Market Monitor 数据
         analysis: AI 分析结果
+        now: 生成时间（可选，推送流程统一传入，默认当前时间）
 
     Returns:
         str: Markdown 内容
     """
-    now = datetime.now()
-    date_str = now.strftime("%Y-%m-%d")
+    now = now or datetime.now()
+    date_str = now.strftime(DATE_FORMAT)
     time_str = now.strftime("%H:%M")
 
     latest = data.get("latest", {}) if data else {}
 
-    # 构建表格数据
-    table_rows = []
-    if data and data.get("data"):
-        for row in data["data"][:10]:  # 最近10天
-            table_rows.append(
-                f"| {row.get('date', '')} | {row.get('up_4pct', '')} | "
-                f"{row.get('down_4pct', '')} | {row.get('ratio_5d', '')} | "
-                f"{row.get('ratio_10d', '')} |"
-            )
-
-    table_content = "\n".join(table_rows) if table_rows else "| 暂无数据 |"
+    # 构建表格数据（最近10天）
+    rows = (data.get("data") or ()) if data else ()
+    table_content = "\n".join(map(format_market_monitor_row, rows[:10])) or "| 暂无数据 |"
 
     md_content = f"""---
 title: Market Monitor {date_str}
@@ -125,7 +158,7 @@ tags:
     return md_content
 
 
-def generate_momentum50_md(data: dict, analysis: str, descriptions: dict = None) -> str:
+def generate_momentum50_md(data: dict, analysis: str, descriptions: dict = None, now: datetime = None) -> str:
     """
     生成 Momentum 50 Markdown 文档
 
@@ -133,12 +166,15 @@ def generate_momentum50_md(data: dict, analysis: str, descriptions: dict = None)
         data: Momentum 50 数据
         analysis: AI 分析结果
         descriptions: 股票简介字典
+        now: 生成时间（可选，推送流程统一传入，默认当前时间）
 
     Returns:
         str: Markdown 内容
     """
-    now = datetime.now()
-    date_str = now.strftime("%Y-%m-%d")
+    from scrapers.momentum50 import get_tradingview_watchlist
+
+    now = now or datetime.now()
+    date_str = now.strftime(DATE_FORMAT)
     time_str = now.strftime("%H:%M")
 
     tickers = data.get("tickers", []) if data else []
@@ -146,28 +182,20 @@ def generate_momentum50_md(data: dict, analysis: str, descriptions: dict = None)
     dropped = data.get("dropped", []) if data else []
     descriptions = descriptions or {}
 
-    # 构建榜单表格
-    ticker_rows = []
-    for i, ticker in enumerate(tickers[:50], 1):
-        desc = descriptions.get(ticker, "-")
-        is_new = "🆕" if ticker in new_entries else ""
-        ticker_rows.append(f"| {i} | {ticker} {is_new} | {desc} |")
-
-    ticker_table = "\n".join(ticker_rows) if ticker_rows else "| 暂无数据 |"
+    # 构建榜单表格（新进标的用集合判断，避免每行线性查找）
+    new_entry_set = set(new_entries)
+    ticker_table = "\n".join(
+        f"| {i} | {ticker} {'🆕' if ticker in new_entry_set else ''} | {descriptions.get(ticker, '-')} |"
+        for i, ticker in enumerate(tickers[:50], 1)
+    ) or "| 暂无数据 |"
 
     # TradingView watchlist
-    tv_list = ",".join([f"NASDAQ:{t}" for t in tickers[:50]])
+    tv_list = get_tradingview_watchlist(tickers[:50])
 
     # 新进入标的
-    new_entries_section = ""
-    if new_entries:
-        new_items = []
-        for ticker in new_entries[:10]:
-            desc = descriptions.get(ticker, "")
-            new_items.append(f"- **{ticker}**: {desc}")
-        new_entries_section = "\n".join(new_items)
-    else:
-        new_entries_section = "今日无新进入标的"
+    new_entries_section = "\n".join(
+        f"- **{ticker}**: {descriptions.get(ticker, '')}" for ticker in new_entries[:10]
+    ) or "今日无新进入标的"
 
     # 掉出标的
     dropped_section = ", ".join(dropped[:10]) if dropped else "无"
@@ -246,12 +274,11 @@ def save_md_file(content: str, category: str, filename: str = None) -> str:
     ensure_dirs()
 
     if not filename:
-        filename = f"{datetime.now().strftime('%Y-%m-%d')}.md"
+        filename = f"{today_str()}.md"
 
     filepath = Path(CLOUD_STORAGE_PATH) / category / filename
 
-    with open(filepath, 'w', encoding='utf-8') as f:
-        f.write(content)
+    filepath.write_bytes(content.encode('utf-8'))
 
     logger.info(f"MD 文件已保存: {filepath}")
     return str(filepath)
@@ -259,6 +286,24 @@ def save_md_file(content: str, category: str, filename: str = None) -> str:
 
 # ============== GitHub 推送 ==============
 
+# GitHub API 会话：限流（429）和瞬时错误自动重试，按响应的 Retry-After 等待
+github_session = requests.Session()
+github_session.mount('https://', HTTPAdapter(
+    max_retries=Retry(total=3, backoff_factor=1, status_forcelist=[429, 502, 503, 504]),
+))
+
+# 本进程已推送的文件: 路径 -> blob SHA，内容未变时连 GET 也不用发
+github_pushed_shas = {}
+
+# 串行化 GET SHA + PUT：并发推送同一分支时会互相使 SHA 失效，导致 409
+github_lock = threading.Lock()
+
+
+def git_blob_sha(raw: bytes) -> str:
+    """计算与 GitHub 返回的 sha 相同的 git blob SHA-1"""
+    return hashlib.sha1(b"blob %d\0" % len(raw) + raw).hexdigest()
+
+
 def push_to_github(content: str, category: str, filename: str = None) -> bool:
     """
     推送 MD 文件到 GitHub obsidian-content 目录
@@ -276,7 +321,7 @@ def push_to_github(content: str, category: str, filename: str = None) -> bool:
         return False
 
     if not filename:
-        filename = f"{datetime.now().strftime('%Y-%m-%d')}.md"
+        filename = f"{today_str()}.md"
 
     # GitHub API 路径
     file_path = f"obsidian-content/{category}/{filename}"
@@ -287,34 +332,48 @@ def push_to_github(content: str, category: str, filename: str = None) -> bool:
         "Accept": "application/vnd.github.v3+json"
     }
 
+    raw = content.encode('utf-8')
+    local_sha = git_blob_sha(raw)
+    if github_pushed_shas.get(file_path) == local_sha:
+        logger.info(f"GitHub 内容未变化，跳过: {file_path}")
+        return True
+
     # Base64 编码内容
-    content_b64 = base64.b64encode(content.encode('utf-8')).decode('utf-8')
+    content_b64 = base64.b64encode(raw).decode('utf-8')
 
     try:
-        # 检查文件是否存在（获取 SHA）
-        existing = requests.get(api_url, headers=headers)
-        sha = None
-        if existing.status_code == 200:
-            sha = existing.json().get('sha')
-
-        # 准备请求数据
-        data = {
-            "message": f"Update {category}/{filename}",
-            "content": content_b64,
-            "branch": GITHUB_BRANCH
-        }
-        if sha:
-            data["sha"] = sha
-
-        # 创建或更新文件
-        response = requests.put(api_url, headers=headers, json=data)
-
-        if response.status_code in [200, 201]:
-            logger.info(f"GitHub 同步成功: {file_path}")
-            return True
-        else:
-            logger.error(f"GitHub 同步失败: {response.status_code} - {response.text}")
-            return False
+        with github_lock:
+            # 检查文件是否存在（获取 SHA）
+            existing = github_session.get(api_url, headers=headers)
+            sha = None
+            if existing.status_code == 200:
+                sha = existing.json().get('sha')
+
+            # 内容与分支上一致时不再提交空更新
+            if sha == local_sha:
+                github_pushed_shas[file_path] = local_sha
+                logger.info(f"GitHub 内容未变化，跳过: {file_path}")
+                return True
+
+            # 准备请求数据
+            data = {
+                "message": f"Update {category}/{filename}",
+                "content": content_b64,
+                "branch": GITHUB_BRANCH
+            }
+            if sha:
+                data["sha"] = sha
+
+            # 创建或更新文件
+            response = github_session.put(api_url, headers=headers, json=data)
+
+            if response.status_code in [200, 201]:
+                github_pushed_shas[file_path] = local_sha
+                logger.info(f"GitHub 同步成功: {file_path}")
+                return True
+            else:
+                logger.error(f"GitHub 同步失败: {response.status_code} - {response.text}")
+                return False
 
     except Exception as e:
         logger.error(f"GitHub 同步异常: {e}")
@@ -323,6 +382,15 @@ def push_to_github(content: str, category: str, filename: str = None) -> bool:
 
 # ============== Telegram 推送 ==============
 
+def get_telegram_bot() -> ExtBot:
+    """获取推送共用的 Telegram Bot"""
+    global telegram_bot
+
+    if telegram_bot is None:
+        telegram_bot = ExtBot(token=TELEGRAM_TOKEN, rate_limiter=telegram_rate_limiter)
+    return telegram_bot
+
+
 async def send_telegram_message(
     text: str,
     parse_mode: str = ParseMode.MARKDOWN,
@@ -344,8 +412,7 @@ async def send_telegram_message(
         return False
 
     try:
-        bot = Bot(token=TELEGRAM_TOKEN)
-        await bot.send_message(
+        await get_telegram_bot().send_message(
             chat_id=CHAT_ID,
             text=text,
             parse_mode=parse_mode,
@@ -358,7 +425,7 @@ async def send_telegram_message(
         return False
 
 
-def format_market_monitor_telegram(data: dict, analysis: str, ob_link: str = None) -> str:
+def format_market_monitor_telegram(data: dict, analysis: str, ob_link: str = None, date_str: str = None) -> str:
     """
     格式化 Market Monitor Telegram 消息
 
@@ -366,12 +433,13 @@ def format_market_monitor_telegram(data: dict, analysis: str, ob_link: str = Non
         data: Market Monitor 数据
         analysis: AI 分析
         ob_link: Obsidian 链接
+        date_str: 日期字符串（可选，默认今天）
 
     Returns:
         str: 格式化的消息
     """
     latest = data.get("latest", {}) if data else {}
-    date_str = datetime.now().strftime("%Y-%m-%d")
+    date_str = date_str or today_str()
 
     # 提取关键数据
     up_4pct = latest.get("up_4pct", "N/A")
@@ -405,7 +473,7 @@ def format_market_monitor_telegram(data: dict, analysis: str, ob_link: str = Non
     return message
 
 
-def format_momentum50_telegram(data: dict, analysis: str, ob_link: str = None) -> str:
+def format_momentum50_telegram(data: dict, analysis: str, ob_link: str = None, date_str: str = None) -> str:
     """
     格式化 Momentum 50 Telegram 消息
 
@@ -413,11 +481,12 @@ def format_momentum50_telegram(data: dict, analysis: str, ob_link: str = None) -
         data: Momentum 50 数据
         analysis: AI 分析
         ob_link: Obsidian 链接
+        date_str: 日期字符串（可选，默认今天）
 
     Returns:
         str: 格式化的消息
     """
-    date_str = datetime.now().strftime("%Y-%m-%d")
+    date_str = date_str or today_str()
     tickers = data.get("tickers", [])[:10] if data else []
     new_entries = data.get("new_entries", []) if data else []
 
@@ -451,51 +520,61 @@ async def push_market_monitor():
     """
     Market Monitor 完整推送流程
     """
-    from scrapers.market_monitor import fetch_market_monitor, analyze_trend
+    from scrapers.market_monitor import fetch_market_monitor
     from utils.ai_analyzer import analyze_market_breadth
 
     logger.info("开始 Market Monitor 推送...")
 
-    # 1. 抓取数据
-    data = fetch_market_monitor()
+    # 1. 抓取数据（同步 I/O 放到线程中，避免阻塞事件循环）
+    # 推送不接受过期缓存（swr=0），过期时同步重新抓取
+    data = await asyncio.to_thread(fetch_market_monitor, swr=0)
     if not data:
         await send_telegram_message("❌ Market Monitor 数据获取失败")
         return False
 
     # 2. AI 分析
-    analysis = analyze_market_breadth(data)
+    analysis = await asyncio.to_thread(analyze_market_breadth, data)
+
+    # 3. 生成 MD（整个流程使用同一时间，避免跨零点时各处日期不一致）
+    now = datetime.now()
+    date_str = now.strftime(DATE_FORMAT)
+    filename = f"{date_str}.md"
 
-    # 3. 生成 MD
-    md_content = generate_market_monitor_md(data, analysis)
-    md_path = save_md_file(md_content, "MarketMonitor")
+    md_content = generate_market_monitor_md(data, analysis, now=now)
+    md_path = await asyncio.to_thread(save_md_file, md_content, "MarketMonitor", filename)
 
-    # 4. 推送到 GitHub
-    push_to_github(md_content, "MarketMonitor")
+    # 4. 推送到 GitHub（与 Telegram 发送互不依赖，并行进行）
+    github_task = asyncio.create_task(
+        asyncio.to_thread(push_to_github, md_content, "MarketMonitor", filename)
+    )
 
     # 5. 发送 Telegram
     # 注意：ob_link 需要配合 Obsidian URI scheme 使用
     # 格式: obsidian://open?vault=Antigravity&file=10_DailyPush/MarketMonitor/2026-02-04
-    date_str = datetime.now().strftime("%Y-%m-%d")
     ob_link = f"obsidian://open?vault=Antigravity&file=10_DailyPush/MarketMonitor/{date_str}"
 
-    message = format_market_monitor_telegram(data, analysis, ob_link)
+    message = format_market_monitor_telegram(data, analysis, ob_link, date_str=date_str)
     await send_telegram_message(message)
+    await github_task
 
     logger.info("Market Monitor 推送完成")
     return True
 
 
-async def push_momentum50():
+async def push_momentum50(fresh: bool = False):
     """
     Momentum 50 完整推送流程
+
+    Args:
+        fresh: 为 True 时跳过 1 小时结果缓存，重新抓取（定时推送使用）
     """
     from scrapers.momentum50 import fetch_momentum50
     from utils.ai_analyzer import analyze_momentum_stocks, get_ticker_descriptions
 
     logger.info("开始 Momentum 50 推送...")
 
-    # 1. 抓取数据
-    data = fetch_momentum50()
+    # 1. 抓取数据（同步 I/O 放到线程中，避免阻塞事件循环）
+    data = await asyncio.to_thread(fetch_momentum50, use_cache=not fresh)
     if not data:
         await send_telegram_message("❌ Momentum 50 数据获取失败")
         return False
@@ -503,24 +582,30 @@ async def push_momentum50():
     # 2. 获取股票简介（可选，消耗 API）
     descriptions = {}
     if data.get("new_entries"):
-        descriptions = get_ticker_descriptions(data["new_entries"][:10])
+        descriptions = await asyncio.to_thread(get_ticker_descriptions, data["new_entries"][:10])
 
     # 3. AI 分析
-    analysis = analyze_momentum_stocks(data)
+    analysis = await asyncio.to_thread(analyze_momentum_stocks, data)
+
+    # 4. 生成 MD（整个流程使用同一时间，避免跨零点时各处日期不一致）
+    now = datetime.now()
+    date_str = now.strftime(DATE_FORMAT)
+    filename = f"{date_str}.md"
 
-    # 4. 生成 MD
-    md_content = generate_momentum50_md(data, analysis, descriptions)
-    md_path = save_md_file(md_content, "Momentum50")
+    md_content = generate_momentum50_md(data, analysis, descriptions, now=now)
+    md_path = await asyncio.to_thread(save_md_file, md_content, "Momentum50", filename)
 
-    # 5. 推送到 GitHub
-    push_to_github(md_content, "Momentum50")
+    # 5. 推送到 GitHub（与 Telegram 发送互不依赖，并行进行）
+    github_task = asyncio.create_task(
+        asyncio.to_thread(push_to_github, md_content, "Momentum50", filename)
+    )
 
     # 6. 发送 Telegram
-    date_str = datetime.now().strftime("%Y-%m-%d")
     ob_link = f"obsidian://open?vault=Antigravity&file=10_DailyPush/Momentum50/{date_str}"
 
-    message = format_momentum50_telegram(data, analysis, ob_link)
+    message = format_momentum50_telegram(data, analysis, ob_link, date_str=date_str)
     await send_telegram_message(message)
+    await github_task
 
     logger.info("Momentum 50 推送完成")
     return True
@@ -534,10 +619,26 @@ async def daily_push_all():
     logger.info("开始每日推送")
     logger.info("=" * 50)
 
-    results = {
-        "market_monitor": await push_market_monitor(),
-        "momentum50": await push_momentum50(),
+    # 两个推送互不依赖，并发执行
+    flows = {
+        "market_monitor": push_market_monitor(),
+        "momentum50": push_momentum50(fresh=True),
     }
+    outcomes = await asyncio.gather(
+        *(asyncio.wait_for(flow, timeout=PUSH_TIMEOUT) for flow in flows.values()),
+        return_exceptions=True
+    )
+
+    results = {}
+    for name, outcome in zip(flows, outcomes):
+        if isinstance(outcome, BaseException):
+            logger.error(f"{name} 推送失败: {outcome!r}")
+            results[name] = False
+        else:
+            results[name] = outcome
+
+    from utils.ai_analyzer import format_ai_stats
+    logger.info(format_ai_stats())
 
     success_count = sum(results.values())
     total_count = len(results)
@@ -561,17 +662,17 @@ async def push_gmail_brief(label: str = None, hours_back: int = None):
     logger.info("开始 Gmail 简报推送...")
 
     # 1. 获取邮件
-    emails = fetch_gmail_emails(label_name=label, hours_back=hours_back)
+    emails = await asyncio.to_thread(fetch_gmail_emails, label_name=label, hours_back=hours_back)
     if not emails:
         await send_telegram_message("📭 *Gmail 简报*\n\n最近没有新邮件")
         return False
 
     # 2. 生成简报
-    brief = generate_gmail_brief(emails)
+    brief = await asyncio.to_thread(generate_gmail_brief, emails)
 
     # 3. 推送到 GitHub (可选)
-    date_str = datetime.now().strftime("%Y-%m-%d")
-    md_content = f"""---
+    date_str = today_str()
+    md_parts = [f"""---
 title: Gmail Brief {date_str}
 date: {date_str}
 type: daily-push
@@ -589,9 +690,9 @@ tags:
 
 ## 邮件列表
 
-"""
+"""]
     for i, email in enumerate(brief['emails'][:20], 1):
-        md_content += f"""### {i}. {email['subject']}
+        md_parts.append(f"""### {i}. {email['subject']}
 
 - **发件人**: {email['sender']}
 - **时间**: {email['date'].strftime('%Y-%m-%d %H:%M')}
@@ -601,14 +702,19 @@ tags:
 
 ---
 
-"""
+""")
+    md_content = "".join(md_parts)
 
     # 保存并推送到 GitHub
-    save_md_file(md_content, "GmailBrief")
-    push_to_github(md_content, "GmailBrief")
+    filename = f"{date_str}.md"
+    await asyncio.to_thread(save_md_file, md_content, "GmailBrief", filename)
+    github_task = asyncio.create_task(
+        asyncio.to_thread(push_to_github, md_content, "GmailBrief", filename)
+    )
 
     # 4. 发送 Telegram
     await send_telegram_message(brief['telegram_message'])
+    await github_task
 
     logger.info("Gmail 简报推送完成")
     return True
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+HTTP Cache
+数据源响应的磁盘缓存（stale-while-revalidate）
+
+- 每个 URL 一个文件，文件修改时间即抓取时间
+- max_age 内直接返回缓存
+- 过期但仍在 max_age + swr 内时先返回旧文件，后台线程重新抓取
+- 完全过期或不存在时同步抓取
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# 缓存目录
+HTTP_CACHE_DIR = os.getenv(
+    'HTTP_CACHE_DIR',
+    os.path.join(os.getenv('CLOUD_STORAGE_PATH', './data'), 'http_cache')
+)
+
+# 正在后台刷新的 URL，避免重复发起
+_revalidating = set()
+_revalidating_lock = threading.Lock()
+
+
+def _cache_path(url: str) -> str:
+    return os.path.join(HTTP_CACHE_DIR, f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.bin")
+
+
+def _download(session: requests.Session, url: str, path: str, timeout: int):
+    """流式下载到临时文件，完成后原子替换"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    try:
+        with session.get(url, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        # 下载中途失败时清理临时文件，避免残留
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _revalidate(session: requests.Session, url: str, path: str, timeout: int):
+    try:
+        _download(session, url, path, timeout)
+        logger.debug(f"后台刷新缓存完成: {url}")
+    except Exception as e:
+        logger.warning(f"后台刷新缓存失败: {e}")
+    finally:
+        with _revalidating_lock:
+            _revalidating.discard(url)
+
+
+def cached_download(
+    session: requests.Session,
+    url: str,
+    max_age: int = 600,
+    swr: int = 3600,
+    timeout: int = 30,
+) -> Optional[str]:
+    """
+    获取 URL 内容的本地缓存文件路径
+
+    Args:
+        session: 发起请求的 HTTP 会话
+        url: 请求地址
+        max_age: 缓存新鲜期（秒）
+        swr: 过期后仍可先返回旧数据的时长（秒）
+        timeout: 请求超时
+
+    Returns:
+        str: 缓存文件路径，抓取失败时退回过期缓存，没有缓存返回 None
+    """
+    path = _cache_path(url)
+
+    try:
+        age = time.time() - os.path.getmtime(path)
+    except OSError:
+        age = None
+
+    if age is not None and age < max_age:
+        logger.debug(f"HTTP 缓存命中: {url}")
+        return path
+
+    if age is not None and age < max_age + swr:
+        with _revalidating_lock:
+            start = url not in _revalidating
+            _revalidating.add(url)
+        if start:
+            threading.Thread(
+                target=_revalidate, args=(session, url, path, timeout), daemon=True
+            ).start()
+        logger.debug(f"HTTP 缓存已过期，先返回旧数据: {url}")
+        return path
+
+    try:
+        _download(session, url, path, timeout)
+    except (requests.exceptions.RequestException, OSError) as e:
+        if age is not None:
+            logger.warning(f"请求失败，使用过期缓存: {e}")
+            return path
+        logger.error(f"请求失败: {e}")
+        return None
+
+    return path
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+JSON I/O
+统一的 JSON 读写：orjson 更快且直接产出 bytes，未安装时回退到标准库 json
+
+- loads / dumps: 解析与序列化（dumps 始终返回 UTF-8 bytes）
+- read_json: 读取 JSON 文件
+- write_json: 先写临时文件再原子替换，并发读取方不会看到写了一半的文件
+"""
+
+import os
+import json
+import threading
+
+try:
+    import orjson
+
+    def dumps(obj, indent: bool = False) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+
+    loads = orjson.loads
+except ImportError:
+    def dumps(obj, indent: bool = False) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None).encode('utf-8')
+
+    loads = json.loads
+
+
+def read_json(path: str):
+    """读取 JSON 文件（文件不存在时抛出 FileNotFoundError，由调用方处理）"""
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def write_json(path: str, obj, indent: bool = False):
+    """原子写入 JSON 文件，失败时清理临时文件并抛出异常"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(dumps(obj, indent=indent))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
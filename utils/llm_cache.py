@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+LLM Cache
+AI 结果磁盘缓存，避免相同内容重复调用大模型
+
+- 键: 输入内容的 SHA256
+- 每个键一个 JSON 文件，原子替换写入，多线程并发安全
+- 读取时按 TTL 判断是否过期，过期文件直接删除
+- 写入时定期清扫超过 DEFAULT_TTL 的文件，目录不会无限增长
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+from utils.json_io import read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+# 缓存目录
+LLM_CACHE_DIR = os.getenv(
+    'LLM_CACHE_DIR',
+    os.path.join(os.getenv('CLOUD_STORAGE_PATH', './data'), 'llm_cache')
+)
+
+# 默认缓存时间（秒）: 7 天，也是所有调用方 TTL 的上限，清扫时按它判断过期
+DEFAULT_TTL = 7 * 24 * 3600
+
+# 清扫过期文件的最小间隔（秒）
+SWEEP_INTERVAL = 24 * 3600
+last_sweep = 0.0
+sweep_lock = threading.Lock()
+
+# 命中统计（多线程并发读写缓存，计数需加锁）
+cache_stats = {"hits": 0, "misses": 0}
+cache_stats_lock = threading.Lock()
+
+
+def make_key(*parts) -> str:
+    """
+    根据任意可 JSON 序列化的内容生成 SHA256 缓存键
+
+    固定使用标准库 json 序列化，保证是否安装 orjson 时键都一致
+    """
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _cache_path(key: str) -> str:
+    """按键前两位分目录，避免单目录文件过多"""
+    return os.path.join(LLM_CACHE_DIR, key[:2], f"{key}.json")
+
+
+def _count(outcome: str) -> dict:
+    """命中/未命中计数加一，返回计数快照"""
+    with cache_stats_lock:
+        cache_stats[outcome] += 1
+        return dict(cache_stats)
+
+
+def get_cached(key: str, ttl: int = DEFAULT_TTL) -> Optional[str]:
+    """
+    读取缓存
+
+    Returns:
+        str: 缓存内容，不存在或已过期返回 None
+    """
+    try:
+        entry = read_json(_cache_path(key))
+    except FileNotFoundError:
+        _count("misses")
+        return None
+    except Exception as e:
+        logger.warning(f"读取 LLM 缓存失败: {e}")
+        _count("misses")
+        return None
+
+    if time.time() - entry.get("ts", 0) > ttl:
+        _count("misses")
+        _remove(key)
+        return None
+
+    stats = _count("hits")
+    logger.debug(f"LLM 缓存命中 (hits={stats['hits']}, misses={stats['misses']})")
+    return entry.get("value")
+
+
+def set_cached(key: str, value: str):
+    """写入缓存（先写临时文件再原子替换）"""
+    try:
+        write_json(_cache_path(key), {"ts": time.time(), "value": value})
+    except Exception as e:
+        logger.warning(f"写入 LLM 缓存失败: {e}")
+
+    sweep_expired()
+
+
+def _remove(key: str):
+    """删除过期的缓存文件（并发删除时文件可能已不存在）"""
+    try:
+        os.remove(_cache_path(key))
+    except OSError:
+        pass
+
+
+def sweep_expired(max_age: int = DEFAULT_TTL):
+    """
+    删除修改时间超过 max_age 的缓存文件
+
+    每 SWEEP_INTERVAL 最多执行一次；其他线程正在清扫时直接返回
+    """
+    global last_sweep
+
+    if time.time() - last_sweep < SWEEP_INTERVAL or not sweep_lock.acquire(blocking=False):
+        return
+
+    try:
+        last_sweep = now = time.time()
+        removed = 0
+        with os.scandir(LLM_CACHE_DIR) as subdirs:
+            for subdir in subdirs:
+                if not subdir.is_dir():
+                    continue
+                with os.scandir(subdir.path) as entries:
+                    for entry in entries:
+                        try:
+                            if now - entry.stat().st_mtime > max_age:
+                                os.remove(entry.path)
+                                removed += 1
+                        except OSError:
+                            pass
+        if removed:
+            logger.info(f"清理过期 LLM 缓存: {removed} 个文件")
+    except OSError as e:
+        logger.warning(f"清理 LLM 缓存失败: {e}")
+    finally:
+        sweep_lock.release()